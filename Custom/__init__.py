@@ -1,17 +1,42 @@
 """
 Custom ML-Agents Networks
+
+Submodules are imported lazily so e.g. `Custom.models` or `Custom.numpy_inference`
+don't pull in mlagents.trainers / torch until something from `networks` is used.
 """
 
+import importlib
+
 __version__ = "0.1.0"
 
-from .networks import CustomActor, CustomCritic
-from .models import ResnetVAE, ResnetEncoder, ResnetDecoder, ResidualBlock
-
-__all__ = [
-    "CustomActor",
-    "CustomCritic",
-    "ResnetVAE",
-    "ResnetEncoder",
-    "ResnetDecoder",
-    "ResidualBlock",
-]
+_LAZY_ATTRS = {
+    "CustomActor": ".networks",
+    "CustomCritic": ".networks",
+    "ResnetVAE": ".models",
+    "ResnetEncoder": ".models",
+    "ResnetDecoder": ".models",
+    "ResidualBlock": ".models",
+    "CheckpointLoader": ".checkpoint",
+    "load_state_dict": ".checkpoint",
+    "export_safetensors": ".checkpoint",
+    "export_numpy": ".checkpoint",
+    "NumpyActor": ".numpy_inference",
+    "LidarQuantizer": ".quantization",
+    "FusionCuriosityRewardProvider": ".curiosity",
+    "PolicyServer": ".policy_server",
+    "PolicyClient": ".policy_server",
+}
+
+__all__ = list(_LAZY_ATTRS)
+
+
+def __getattr__(name):
+    if name not in _LAZY_ATTRS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_LAZY_ATTRS[name], __name__), name)
+    globals()[name] = value  # cache, later lookups skip __getattr__
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -0,0 +1,214 @@
+"""
+Checkpoint I/O for the custom networks.
+Fast, lazy loading of ml-agents checkpoints (torch mmap or safetensors) into reusable module skeletons.
+"""
+
+import contextlib
+import io
+import json
+import os
+import re
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from mlagents.torch_utils import torch, nn
+
+from .numpy_inference import NUMPY_EXPORT_VERSION, META_KEY
+
+POLICY_KEY = "Policy"
+CRITIC_KEY = "Optimizer:critic"
+_SEP = "/"  # safetensors keys are flat: "<module>/<param>"
+_STEP_RE = re.compile(r"-(\d+)\.(pt|safetensors)$")
+
+
+def _safetensors():
+    try:
+        import safetensors.torch
+    except ImportError as e:
+        raise ImportError("safetensors is not installed, run `uv sync --extra safetensors`") from e
+    return safetensors
+
+
+def list_checkpoints(run_dir: str, ext: str = ".pt") -> List[Tuple[int, str]]:
+    """Return (step, path) for every `<behavior>-<step>` checkpoint under run_dir, sorted by step"""
+    found = []
+    for root, _, files in os.walk(run_dir):
+        for name in files:
+            match = _STEP_RE.search(name)
+            if match and name.endswith(ext):
+                found.append((int(match.group(1)), os.path.join(root, name)))
+    return sorted(found)
+
+
+def export_safetensors(checkpoint_path: str, out_path: Optional[str] = None) -> str:
+    """
+    Convert an ml-agents `.pt` checkpoint to safetensors.
+    Only flat tensor state dicts (Policy, critic, global_step...) are kept, optimizer state is dropped.
+    """
+    st = _safetensors()
+    out_path = out_path or os.path.splitext(checkpoint_path)[0] + ".safetensors"
+    ckpt = torch.load(checkpoint_path, map_location="cpu", mmap=True, weights_only=True)
+
+    tensors = {}
+    for module_name, state in ckpt.items():
+        if not isinstance(state, dict) or not all(isinstance(v, torch.Tensor) for v in state.values()):
+            continue
+        for name, value in state.items():
+            tensors[f"{module_name}{_SEP}{name}"] = value.contiguous()
+
+    st.torch.save_file(tensors, out_path, metadata={"format": "pt"})
+    return out_path
+
+
+def load_state_dict(path: str, module: str = POLICY_KEY, mmap: bool = True) -> Dict[str, torch.Tensor]:
+    """
+    Load the state dict of a single module (e.g. just the actor) from a checkpoint.
+    safetensors only reads the requested tensors, `.pt` files are memory mapped so untouched modules never get paged in.
+    """
+    if path.endswith(".safetensors"):
+        st = _safetensors()
+        prefix = module + _SEP
+        state = {}
+        with st.safe_open(path, framework="pt", device="cpu") as f:
+            for key in f.keys():
+                if key.startswith(prefix):
+                    state[key[len(prefix):]] = f.get_tensor(key)
+        if not state:
+            raise KeyError(f"{module} not found in {path}")
+        return state
+
+    ckpt = torch.load(path, map_location="cpu", mmap=mmap, weights_only=True)
+    if module not in ckpt:
+        raise KeyError(f"{module} not found in {path} (has {list(ckpt.keys())})")
+    return ckpt[module]
+
+
+def _sequential_program(seq: nn.Sequential, prefix: str) -> List[Dict]:
+    # Flatten a LidarCnn / StateMlp Sequential into ops the numpy runtime can replay
+    ops = []
+    for i, layer in enumerate(seq):
+        name = f"{prefix}.{i}"
+        if isinstance(layer, nn.Conv1d):
+            assert layer.dilation[0] == 1 and layer.groups == 1 and isinstance(layer.padding, tuple), \
+                "numpy export only supports plain Conv1d"
+            ops.append({"op": "conv1d", "name": name, "stride": layer.stride[0], "padding": layer.padding[0]})
+        elif isinstance(layer, nn.BatchNorm1d):
+            ops.append({"op": "batchnorm", "name": name, "eps": layer.eps})
+        elif isinstance(layer, nn.Linear):
+            ops.append({"op": "linear", "name": name})
+        elif isinstance(layer, (nn.Dropout, nn.Identity)):
+            continue  # no-ops at inference
+        else:
+            ops.append({"op": "act", "name": type(layer).__name__})
+    return ops
+
+
+def export_numpy(actor: nn.Module, path: str) -> str:
+    """Export CustomActor weights + layout to `.npz` for Custom.numpy_inference.NumpyActor"""
+    encoder = actor.encoder
+    if encoder.fusion_mode != "attention":
+        raise ValueError(f"numpy export only supports the attention fusion mode, got {encoder.fusion_mode}")
+    fusion = encoder.sensor_fusion
+    meta = {
+        "version": NUMPY_EXPORT_VERSION,
+        "lidar_indices": list(encoder.lidar_indices),
+        "state_indices": list(encoder.state_indices),
+        "context_length": encoder.context_length,
+        "num_embeddings": encoder.num_embeddings,
+        "num_head": fusion.attn.num_head,
+        "ln_eps": fusion.ln1.eps,
+        "normalize": bool(encoder.normalize),
+        "norm_eps": encoder.state_norm.eps if encoder.normalize else 0.0,
+        "lidar_cnn": _sequential_program(fusion.lidar_cnn.cnn, "encoder.sensor_fusion.lidar_cnn.cnn"),
+        "state_mlp": _sequential_program(fusion.state_mlp.mlp, "encoder.sensor_fusion.state_mlp.mlp"),
+        "pool_act": type(fusion.pool[1]).__name__,
+        "fusion_act": type(fusion.fusion_mlp[1]).__name__,
+        "continuous_size": int(actor.action_spec.continuous_size),
+        "discrete_branches": [int(b) for b in actor.action_spec.discrete_branches],
+        "clip_action": bool(actor.action_model.clip_action),
+        "lidar_quant": None if encoder.lidar_quantizer is None else {
+            "scale": encoder.lidar_quantizer.scale.tolist(),
+            "offset": encoder.lidar_quantizer.offset.tolist(),
+        },
+    }
+    arrays = {
+        name: value.detach().cpu().numpy()
+        for name, value in actor.state_dict().items()
+        if value.is_floating_point()  # skips BatchNorm num_batches_tracked
+    }
+    np.savez(path, **{META_KEY: np.array(json.dumps(meta))}, **arrays)
+    return path if path.endswith(".npz") else path + ".npz"
+
+
+@contextlib.contextmanager
+def _quiet(enabled: bool = True):
+    # Encoder prints its observation spec banner on construction
+    if not enabled:
+        yield
+        return
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+def build_actor(observation_specs, network_settings, action_spec, quiet: bool = True, **kwargs) -> nn.Module:
+    """Build a CustomActor skeleton (no debug banner by default)"""
+    from .networks import CustomActor
+    with _quiet(quiet):
+        return CustomActor(observation_specs, network_settings, action_spec, **kwargs)
+
+
+def build_critic(observation_specs, network_settings, stream_names, quiet: bool = True, **kwargs) -> nn.Module:
+    """Build a CustomCritic skeleton (no debug banner by default)"""
+    from .networks import CustomCritic
+    with _quiet(quiet):
+        return CustomCritic(observation_specs, network_settings, stream_names, **kwargs)
+
+
+class CheckpointLoader:
+    """
+    Loads checkpoints into pre-built actor / critic skeletons, reusing them across loads.
+
+    loader = CheckpointLoader(actor=build_actor(specs, settings, action_spec))
+    for step, path in list_checkpoints("results/run"):
+        actor = loader.load(path)
+    """
+
+    def __init__(
+            self,
+            actor: Optional[nn.Module] = None,
+            critic: Optional[nn.Module] = None,
+            mmap: bool = True,
+            assign: bool = False,
+    ):
+        assert actor is not None or critic is not None, "CheckpointLoader needs an actor or critic skeleton"
+        self.actor = actor.eval() if actor is not None else None
+        self.critic = critic.eval() if critic is not None else None
+        self.mmap = mmap
+        # assign=True swaps the skeleton's tensors for the loaded (mmap'd) ones instead of copying into them
+        self.assign = assign
+
+    def _load_into(self, module: nn.Module, path: str, key: str) -> nn.Module:
+        state = load_state_dict(path, key, mmap=self.mmap)
+        module.load_state_dict(state, assign=self.assign)
+        return module
+
+    def load_actor(self, path: str) -> nn.Module:
+        assert self.actor is not None, "No actor skeleton"
+        return self._load_into(self.actor, path, POLICY_KEY)
+
+    def load_critic(self, path: str) -> nn.Module:
+        assert self.critic is not None, "No critic skeleton"
+        return self._load_into(self.critic, path, CRITIC_KEY)
+
+    def load(self, path: str):
+        """Load whichever skeletons were given, returns actor, critic or (actor, critic)"""
+        actor = self.load_actor(path) if self.actor is not None else None
+        critic = self.load_critic(path) if self.critic is not None else None
+        if actor is None: return critic
+        if critic is None: return actor
+        return actor, critic
+
+    def iter_run(self, run_dir: str, ext: str = ".pt") -> Iterable[Tuple[int, object]]:
+        """Yield (step, loaded modules) for every checkpoint of a run"""
+        for step, path in list_checkpoints(run_dir, ext):
+            yield step, self.load(path)
@@ -0,0 +1,261 @@
+"""
+Curiosity reward on SensorFusion encodings.
+ml-agents' CuriosityRewardProvider trains its own encoder over the same lidar / state observations;
+this one runs its forward / inverse models on encodings from a frozen snapshot of the policy's Encoder.
+"""
+
+import copy
+from typing import Dict, List, Optional
+
+import numpy as np
+from mlagents.torch_utils import torch, nn, default_device
+
+from mlagents_envs import logging_util
+from mlagents_envs.base_env import BehaviorSpec
+from mlagents.trainers.buffer import AgentBuffer, BufferKey
+from mlagents.trainers.optimizer.torch_optimizer import TorchOptimizer
+from mlagents.trainers.settings import CuriositySettings, RewardSignalType
+from mlagents.trainers.torch_entities.action_flattener import ActionFlattener
+from mlagents.trainers.torch_entities.agent_action import AgentAction
+from mlagents.trainers.torch_entities.layers import LinearEncoder, linear_layer
+from mlagents.trainers.torch_entities.utils import ModelUtils
+from mlagents.trainers.torch_entities.components.reward_providers.base_reward_provider import BaseRewardProvider
+from mlagents.trainers.torch_entities.components.reward_providers.curiosity_reward_provider import (
+    CuriosityRewardProvider, ActionPredictionTuple,
+)
+from mlagents.trainers.trajectory import ObsUtil
+
+logger = logging_util.get_logger(__name__)
+
+def install() -> None:
+    """
+    Use FusionCuriosityRewardProvider for the `curiosity` reward signal, on the encoder of the optimizer's policy.
+    Patches ml-agents' TorchOptimizer for this process, call before the trainers are created (Custom.learn).
+    """
+    create_reward_signals = TorchOptimizer.create_reward_signals
+
+    def create_reward_signals_on_encoder(self, reward_signal_configs) -> None:
+        for signal, settings in reward_signal_configs.items():  # same order as the stock signals
+            if signal != RewardSignalType.CURIOSITY:
+                create_reward_signals(self, {signal: settings})
+                continue
+            encoder = getattr(self.policy.actor, "encoder", None)
+            if encoder is None:
+                raise TypeError(f"FusionCuriosity needs a CustomActor policy, got {type(self.policy.actor).__name__}")
+            self.reward_signals[signal.value] = FusionCuriosityRewardProvider(
+                self.policy.behavior_spec, settings, encoder
+            )
+
+    TorchOptimizer.create_reward_signals = create_reward_signals_on_encoder
+
+
+class FusionCuriosityNetwork(nn.Module):
+    """Curiosity forward / inverse models on (current, next) encodings, same losses as ml-agents' CuriosityNetwork"""
+
+    EPSILON = 1e-10
+
+    def __init__(self, specs: BehaviorSpec, encoding_size: int, hidden_units: int = 256):
+        super().__init__()
+        self._action_spec = specs.action_spec
+        self._action_flattener = ActionFlattener(self._action_spec)
+
+        self.inverse_model_action_encoding = nn.Sequential(LinearEncoder(2 * encoding_size, 1, hidden_units))
+        if self._action_spec.continuous_size > 0:
+            self.continuous_action_prediction = linear_layer(hidden_units, self._action_spec.continuous_size)
+        if self._action_spec.discrete_size > 0:
+            self.discrete_action_prediction = linear_layer(hidden_units, sum(self._action_spec.discrete_branches))
+
+        self.forward_model_next_state_prediction = nn.Sequential(
+            LinearEncoder(encoding_size + self._action_flattener.flattened_size, 1, hidden_units),
+            linear_layer(hidden_units, encoding_size),
+        )
+
+    def predict_action(self, current: torch.Tensor, next_: torch.Tensor) -> ActionPredictionTuple:
+        hidden = self.inverse_model_action_encoding(torch.cat((current, next_), dim=1))
+        continuous_pred, discrete_pred = None, None
+        if self._action_spec.continuous_size > 0:
+            continuous_pred = self.continuous_action_prediction(hidden)
+        if self._action_spec.discrete_size > 0:
+            branches = ModelUtils.break_into_branches(
+                self.discrete_action_prediction(hidden), self._action_spec.discrete_branches
+            )
+            discrete_pred = torch.cat([torch.softmax(b, dim=1) for b in branches], dim=1)
+        return ActionPredictionTuple(continuous_pred, discrete_pred)
+
+    def predict_next_state(self, current: torch.Tensor, actions: AgentAction) -> torch.Tensor:
+        return self.forward_model_next_state_prediction(
+            torch.cat((current, self._action_flattener.forward(actions)), dim=1)
+        )
+
+    def compute_inverse_loss(self, current, next_, mini_batch: AgentBuffer, masks: torch.Tensor) -> torch.Tensor:
+        predicted_action = self.predict_action(current, next_)
+        actions = AgentAction.from_buffer(mini_batch)
+        loss = 0
+        if self._action_spec.continuous_size > 0:
+            sq_difference = torch.sum((actions.continuous_tensor - predicted_action.continuous) ** 2, dim=1)
+            loss += torch.mean(ModelUtils.dynamic_partition(sq_difference, masks, 2)[1])
+        if self._action_spec.discrete_size > 0:
+            true_action = torch.cat(
+                ModelUtils.actions_to_onehot(actions.discrete_tensor, self._action_spec.discrete_branches), dim=1
+            )
+            cross_entropy = torch.sum(-torch.log(predicted_action.discrete + self.EPSILON) * true_action, dim=1)
+            loss += torch.mean(ModelUtils.dynamic_partition(cross_entropy, masks, 2)[1])
+        return loss
+
+    def compute_reward(self, current, next_, mini_batch: AgentBuffer) -> torch.Tensor:
+        predicted_next = self.predict_next_state(current, AgentAction.from_buffer(mini_batch))
+        return torch.sum(0.5 * (next_ - predicted_next) ** 2, dim=1)
+
+    def compute_forward_loss(self, current, next_, mini_batch: AgentBuffer, masks: torch.Tensor) -> torch.Tensor:
+        return torch.mean(ModelUtils.dynamic_partition(self.compute_reward(current, next_, mini_batch), masks, 2)[1])
+
+
+def _chained_rows(obs: List[np.ndarray], next_obs: List[np.ndarray]) -> np.ndarray:
+    """chained[t]: next_obs[t] is obs[t + 1], i.e. rows t, t + 1 are consecutive steps of one trajectory"""
+    chained = np.zeros(len(obs[0]), dtype=bool)
+    chained[:-1] = True
+    for o, n in zip(obs, next_obs):
+        chained[:-1] &= (n[:-1] == o[1:]).reshape(len(o) - 1, -1).all(axis=1)
+    return chained
+
+
+class FusionCuriosityRewardProvider(BaseRewardProvider):
+    """
+    Drop-in for the `curiosity` reward signal (see install), forward / inverse models on Encoder outputs.
+    - evaluate reads the encodings the policy computed during the rollout back from the stored memories
+      (Encoder.rollout_encodings), only trajectory ends and "linear" mode are encoded again, with a no-grad snapshot
+      of the policy Encoder refreshed at the first evaluate after an update round
+    - the snapshot runs in the policy's train / eval mode, ml-agents rolls out in train mode so cached, re-encoded
+      and training encodings all carry dropout (re-encoded rows with another dropout sample than the rollout drew)
+    - update reuses the detached encodings of the policy pass over the same minibatch (Encoder.last_training_encoding),
+      rows at the end of a sequence have no next encoding there and are left out of the losses
+    - lidar_codes: update minibatches hold compact lidar codes (set by quantization.install), evaluate always
+      sees float32 trajectories
+    """
+
+    beta = CuriosityRewardProvider.beta
+    loss_multiplier = CuriosityRewardProvider.loss_multiplier
+
+    def __init__(self, specs: BehaviorSpec, settings: CuriositySettings, encoder: nn.Module) -> None:
+        super().__init__(specs, settings)
+        self._ignore_done = True
+
+        self._source = encoder  # the policy's Encoder
+        self._snapshot = copy.deepcopy(self._source).requires_grad_(False)
+        self._snapshot.to(default_device())
+        self._snapshot_stale = False  # the policy was updated since the last refresh
+
+        self._network = FusionCuriosityNetwork(specs, self._source.num_embeddings)
+        self._network.to(default_device())
+        self.optimizer = torch.optim.Adam(self._network.parameters(), lr=settings.learning_rate)
+        self._has_updated_once = False
+        self.lidar_codes = False
+
+    def refresh_snapshot(self) -> None:
+        self._snapshot.load_state_dict(self._source.state_dict())
+        self._snapshot_stale = False
+
+    def _observations(self, mini_batch: AgentBuffer):
+        num_obs = len(self._policy_specs.observation_specs)
+        obs = [o.to_ndarray() for o in ObsUtil.from_buffer(mini_batch, num_obs)]
+        next_obs = [o.to_ndarray() for o in ObsUtil.from_buffer_next(mini_batch, num_obs)]
+        return obs, next_obs
+
+    def _stored_memories(self, mini_batch: AgentBuffer) -> Optional[torch.Tensor]:
+        # Per-step memories (inputs of that step), None if the buffer has none
+        if len(mini_batch[BufferKey.MEMORY]) > 0:
+            return ModelUtils.list_to_tensor(mini_batch[BufferKey.MEMORY]).to(default_device())
+        return None
+
+    @torch.no_grad()
+    def _encodings(self, mini_batch: AgentBuffer, lidar_codes: bool = False):
+        """(current, next) encodings for every row"""
+        device = default_device()
+        self._snapshot.train(self._source.training)  # same dropout / BatchNorm mode as the rollout
+        obs, next_obs = self._observations(mini_batch)
+        chained = _chained_rows(obs, next_obs)
+        rows = len(chained)
+        memories = self._stored_memories(mini_batch)
+
+        # Row t + 1's input memory holds row t's encoding where the rows chain
+        hit = np.flatnonzero(chained)
+        hit_t = torch.from_numpy(hit).to(device)
+        cached = None
+        if memories is not None and len(hit) > 0:
+            cached = self._snapshot.rollout_encodings(memories, torch.from_numpy(chained).to(device))
+
+        current = torch.empty(rows, self._snapshot.num_embeddings, device=device)
+        if cached is None:
+            rest = np.arange(rows)
+        else:
+            rest = np.flatnonzero(~chained)  # trajectory ends (or unordered rows)
+            current[hit_t] = cached[hit_t]
+        if memories is None:
+            memories = torch.zeros(rows, self._snapshot.memory_size, device=device)
+
+        memories_next = None
+        if len(rest) > 0:
+            rest_t = torch.from_numpy(rest).to(device)
+            current[rest_t], memories_next = self._snapshot.encode(
+                [torch.as_tensor(o[rest], dtype=torch.float32, device=device) for o in obs],
+                memories[rest_t].unsqueeze(0),
+                lidar_codes=lidar_codes,
+            )
+
+        next_ = torch.empty_like(current)
+        next_[hit_t] = current[hit_t + 1]
+        ends = np.flatnonzero(~chained)
+        if len(ends) > 0:
+            ends_t = torch.from_numpy(ends).to(device)
+            at = torch.from_numpy(np.searchsorted(rest, ends)).to(device)  # ends are a subset of rest
+            next_[ends_t], _ = self._snapshot.encode(
+                [torch.as_tensor(n[ends], dtype=torch.float32, device=device) for n in next_obs],
+                memories_next[:, at],
+                lidar_codes=lidar_codes,
+            )
+        return current, next_
+
+    def _training_encodings(self, mini_batch: AgentBuffer):
+        """(current, next, valid) from the policy pass over this minibatch, None if there was none"""
+        current = self._source.last_training_encoding
+        self._source.last_training_encoding = None  # consumed
+        if current is None or current.shape[0] != mini_batch.num_experiences:
+            return None
+        chained = _chained_rows(*self._observations(mini_batch))
+        next_ = torch.roll(current, -1, dims=0)  # only read where chained
+        return current, next_, torch.as_tensor(chained, dtype=torch.float, device=current.device)
+
+    def evaluate(self, mini_batch: AgentBuffer) -> np.ndarray:
+        if self._snapshot_stale:
+            self.refresh_snapshot()  # once per update round, the rollouts since used the updated policy
+        current, next_ = self._encodings(mini_batch)
+        with torch.no_grad():
+            rewards = ModelUtils.to_numpy(self._network.compute_reward(current, next_, mini_batch))
+        rewards = np.minimum(rewards, 1.0 / self.strength)
+        return rewards * self._has_updated_once
+
+    def update(self, mini_batch: AgentBuffer) -> Dict[str, np.ndarray]:
+        self._snapshot_stale = True
+        self._has_updated_once = True
+
+        masks = ModelUtils.list_to_tensor(mini_batch[BufferKey.MASKS], dtype=torch.float)
+        encodings = self._training_encodings(mini_batch)
+        if encodings is None:
+            current, next_ = self._encodings(mini_batch, self.lidar_codes)
+        else:
+            current, next_, valid = encodings
+            masks = masks * valid
+        forward_loss = self._network.compute_forward_loss(current, next_, mini_batch, masks)
+        inverse_loss = self._network.compute_inverse_loss(current, next_, mini_batch, masks)
+
+        loss = self.loss_multiplier * (self.beta * forward_loss + (1.0 - self.beta) * inverse_loss)
+        self.optimizer.zero_grad()
+        loss.backward()
+        self.optimizer.step()
+        return {
+            "Losses/Curiosity Forward Loss": forward_loss.item(),
+            "Losses/Curiosity Inverse Loss": inverse_loss.item(),
+        }
+
+    def get_modules(self):
+        return {f"Module:{self.name}": self._network}
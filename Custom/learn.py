@@ -0,0 +1,36 @@
+"""
+mlagents-learn with the Custom trainer hooks installed first.
+
+    python -m Custom.learn <config> [mlagents-learn args] [--fusion-curiosity] [--lidar-quant {uint8,float16}]
+
+--fusion-curiosity  the `curiosity` reward signal uses FusionCuriosityRewardProvider (curiosity.install)
+--lidar-quant       the PPO update buffer keeps lidar observations as uint8 / float16 codes (quantization.install)
+
+The hooks patch ml-agents in this process, so they have to be installed before learn.main() creates the trainers.
+"""
+
+import argparse
+import sys
+
+from mlagents.trainers import learn
+
+from . import curiosity, quantization
+
+
+def main():
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument("--fusion-curiosity", action="store_true")
+    parser.add_argument("--lidar-quant", choices=list(quantization.QUANT_DTYPES))
+    args, rest = parser.parse_known_args()
+
+    if args.fusion_curiosity:
+        curiosity.install()
+    if args.lidar_quant:
+        quantization.install(args.lidar_quant)
+
+    sys.argv = [sys.argv[0], *rest]  # the rest goes to mlagents-learn
+    learn.main()
+
+
+if __name__ == "__main__":
+    main()
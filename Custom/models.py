@@ -241,27 +241,143 @@ class CausalSelfAttention(nn.Module):
         self.num_head = config.num_head
         self.scale = (config.num_embeddings // config.num_head) ** -0.5
 
-    def forward(self, x):
+    def forward(self, x, num_queries=None, window=None):
+        # num_queries: only the last num_queries positions attend (default all T)
+        # window: each position sees itself and at most `window` previous positions (default all, up to block_size)
         B, T, C = x.size()
+        Q = T if num_queries is None else num_queries
 
         # calc key, query, values | move head forward to be the batch dim
         # (batch size, num heads, sequence length, head size) -> (B, nh, T, hs)
         k = self.key(x).view(B, T, self.num_head, C // self.num_head).transpose(1, 2)
-        q = self.query(x).view(B, T, self.num_head, C // self.num_head).transpose(1, 2)
+        q = self.query(x[:, T - Q:]).view(B, Q, self.num_head, C // self.num_head).transpose(1, 2)
         v = self.value(x).view(B, T, self.num_head, C // self.num_head).transpose(1, 2)
 
-        # causal self-attention; compute q·k/sqrt(dk) | Self-attend: (B, nh, T, hs) x (B, nh, hs, T) -> (B, nh, T, T)
+        # causal self-attention; compute q·k/sqrt(dk) | Self-attend: (B, nh, Q, hs) x (B, nh, hs, T) -> (B, nh, Q, T)
         attention = (q @ k.transpose(-2, -1)) * self.scale
-        attention = attention.masked_fill(self.mask[:, :, :T, :T] == 0, float('-inf'))
+        attention = attention.masked_fill(self._causal_mask(T, Q, window) == 0, float('-inf'))
         attention = F.softmax(attention, dim=-1)
         attention = self.attention_drop(attention)
-        y = attention @ v  # (B, nh, T, T) x (B, nh, T, hs) -> (B, nh, T, hs)
-        y = y.transpose(1, 2).contiguous().view(B, T, C)  # re-assemble all head outputs side by side
+        y = attention @ v  # (B, nh, Q, T) x (B, nh, T, hs) -> (B, nh, Q, hs)
+        y = y.transpose(1, 2).contiguous().view(B, Q, C)  # re-assemble all head outputs side by side
 
         # output projection
         y = self.residual_drop(self.proj(y))
         return y
 
+    def _causal_mask(self, T, Q, window):
+        if window is None and T <= self.mask.size(-1):
+            return self.mask[:, :, T - Q:T, :T]
+        # banded mask, built per call since context + sequence can exceed block_size
+        query_pos = torch.arange(T - Q, T, device=self.mask.device)[:, None]
+        key_pos = torch.arange(T, device=self.mask.device)[None, :]
+        visible = key_pos <= query_pos
+        if window is not None:
+            visible &= key_pos >= query_pos - window
+        return visible.view(1, 1, Q, T)
+
+class LinearCausalAttention(nn.Module):
+    """
+    Decayed causal linear attention (RetNet style per-head decay, elu+1 feature map).
+    Context lives in a fixed-size state (kv: (B, nh, hs, hs), z: (B, nh, hs)) instead of a token window,
+    with a parallel form for training sequences and an O(1) recurrent form for rollout.
+    """
+    def __init__(self, config):
+        super().__init__()
+        self.config = config
+
+        # key, query, value projections
+        self.key = nn.Linear(config.num_embeddings, config.num_embeddings)
+        self.query = nn.Linear(config.num_embeddings, config.num_embeddings)
+        self.value = nn.Linear(config.num_embeddings, config.num_embeddings)
+
+        # dropout
+        self.residual_drop = nn.Dropout(config.residual_drop)
+
+        # output projection
+        self.proj = nn.Linear(config.num_embeddings, config.num_embeddings)
+
+        self.num_head = config.num_head
+        self.head_size = config.num_embeddings // config.num_head
+        self.eps = 1e-6
+
+        # per head decay 1 - 2^(-5-h): head 0 forgets fastest (~32 steps), later heads keep longer context
+        decay = 1 - 2.0 ** (-5 - torch.arange(config.num_head, dtype=torch.float32))
+        self.register_buffer("log_decay", torch.log(decay).view(1, -1, 1, 1), persistent=False)
+
+    @property
+    def state_size(self) -> int:
+        return self.num_head * self.head_size * (self.head_size + 1)
+
+    def split_state(self, state):
+        # (B, state_size) -> kv (B, nh, hs, hs), z (B, nh, hs)
+        kv_size = self.num_head * self.head_size * self.head_size
+        kv = state[:, :kv_size].reshape(-1, self.num_head, self.head_size, self.head_size)
+        z = state[:, kv_size:].reshape(-1, self.num_head, self.head_size)
+        return kv, z
+
+    def merge_state(self, kv, z):
+        return torch.cat([kv.flatten(start_dim=1), z.flatten(start_dim=1)], dim=1)
+
+    def forward(self, x, state):
+        # x: (B, L, C), state: (B, state_size) -> y: (B, L, C), state: (B, state_size)
+        B, L, C = x.size()
+
+        # (B, nh, L, hs), positive feature map for q and k
+        q = F.elu(self.query(x).view(B, L, self.num_head, self.head_size).transpose(1, 2)) + 1
+        k = F.elu(self.key(x).view(B, L, self.num_head, self.head_size).transpose(1, 2)) + 1
+        v = self.value(x).view(B, L, self.num_head, self.head_size).transpose(1, 2)
+
+        kv, z = self.split_state(state)
+        if L == 1:
+            y, kv, z = self._recurrent(q, k, v, kv, z)
+        else:
+            y, kv, z = self._parallel(q, k, v, kv, z)
+
+        y = y.transpose(1, 2).contiguous().view(B, L, C)
+        y = self.residual_drop(self.proj(y))
+        return y, self.merge_state(kv, z)
+
+    def _recurrent(self, q, k, v, kv, z):
+        # kv_t = g * kv_{t-1} + k_t^T v_t, z_t = g * z_{t-1} + k_t, y_t = q_t kv_t / (q_t . z_t)
+        decay = self.log_decay.exp()
+        kv = decay * kv + k.transpose(-2, -1) @ v
+        z = decay[..., 0] * z + k[:, :, 0]
+        num = q @ kv  # (B, nh, 1, hs)
+        den = (q * z.unsqueeze(2)).sum(-1, keepdim=True)
+        return num / (den + self.eps), kv, z
+
+    def _parallel(self, q, k, v, kv, z):
+        # Same recurrence unrolled over L: D[t, s] = g^(t-s) for s <= t, carried state decays by g^(t+1)
+        L = q.size(2)
+        t = torch.arange(L, device=q.device, dtype=q.dtype)
+        diff = t.view(-1, 1) - t.view(1, -1)
+        decay_mask = torch.exp(self.log_decay * diff.clamp(min=0)) * (diff >= 0)  # (1, nh, L, L)
+
+        attention = (q @ k.transpose(-2, -1)) * decay_mask  # (B, nh, L, L)
+        q_carry = q * torch.exp(self.log_decay * (t + 1).view(-1, 1))  # state from before the sequence
+        num = attention @ v + q_carry @ kv
+        den = attention.sum(-1, keepdim=True) + (q_carry * z.unsqueeze(2)).sum(-1, keepdim=True)
+
+        # Final state after the last step
+        k_out = k * torch.exp(self.log_decay * (L - 1 - t).view(-1, 1))
+        decay_L = torch.exp(self.log_decay * L)
+        kv = decay_L * kv + k_out.transpose(-2, -1) @ v
+        z = decay_L[..., 0] * z + k_out.sum(2)
+        return num / (den + self.eps), kv, z
+
+class LidarDequantize(nn.Module):
+    """uint8 / fp16 lidar codes (or the codes already cast to float) -> float32 with per-channel scale and offset"""
+    def __init__(self, scale, offset):
+        super().__init__()
+        # not persistent, derived from the quantization config so checkpoints stay interchangeable
+        self.register_buffer("scale", torch.as_tensor(scale, dtype=torch.float32).view(1, -1, 1), persistent=False)
+        self.register_buffer("offset", torch.as_tensor(offset, dtype=torch.float32).view(1, -1, 1), persistent=False)
+
+    def forward(self, x):
+        # x: (B, C, R)
+        return torch.addcmul(self.offset, x.float(), self.scale)
+
 @dataclass
 class LidarCnnConfig:
     in_channels: int = 6
@@ -341,6 +457,13 @@ class SensorFusionConfig:
     attention_drop: float = 0.1
     residual_drop: float = 0.1
 
+    # "attention": softmax attention over a window of block_size past tokens
+    # "linear": decayed linear attention with a fixed-size recurrent state
+    # "tokens": softmax attention over a window of block_size past pre-attention tokens, parallel over time
+    fusion_mode: str = "attention"
+
+FUSION_MODES = ("attention", "linear", "tokens")
+
 class SensorFusion(nn.Module):
     """Lidar CNN + State MLP → Attention → Action"""
 
@@ -362,7 +485,10 @@ class SensorFusion(nn.Module):
         # Attention Fusion
         self.ln1 = nn.LayerNorm(config.num_embeddings)
         self.ln2 = nn.LayerNorm(config.num_embeddings)
-        self.attn = CausalSelfAttention(config)
+        if config.fusion_mode not in FUSION_MODES:
+            raise ValueError(f"Unknown fusion_mode {config.fusion_mode}, expected one of {FUSION_MODES}")
+        self.fusion_mode = config.fusion_mode
+        self.attn = LinearCausalAttention(config) if config.fusion_mode == "linear" else CausalSelfAttention(config)
         self.fusion_mlp = nn.Sequential(
             nn.Linear(config.num_embeddings, 4 * config.num_embeddings),
             nn.GELU(),
@@ -370,10 +496,9 @@ class SensorFusion(nn.Module):
             nn.Dropout(config.residual_drop),
         )
 
-    def forward(self, lidar_inputs, state_inputs, past_tokens=None):
+    def embed(self, lidar_inputs, state_inputs):
         # lidar_x: (B, 6, R)
         # state_x: (B, state_dim)
-        # past_tokens: (B, T, embed) or None
 
         # Lidar -> per-ray features
         l_out = self.lidar_cnn(lidar_inputs).transpose(1, 2)  # (B, R, out)
@@ -385,7 +510,13 @@ class SensorFusion(nn.Module):
 
         # Fuse
         x = torch.cat([s_out, l_out], 1)   # (B, R+1, embed)
-        x = self.pool(x.mean(dim=1, keepdim=True))  # (B, embed)
+        return self.pool(x.mean(dim=1, keepdim=True))  # (B, 1, embed)
+
+    def forward(self, lidar_inputs, state_inputs, past_tokens=None):
+        # lidar_x: (B, 6, R)
+        # state_x: (B, state_dim)
+        # past_tokens: (B, T, embed) or None
+        x = self.embed(lidar_inputs, state_inputs)
 
         # Concat with past tokens for attention context
         x = torch.cat([past_tokens, x], dim=1)  # (B, T+1, embed)
@@ -394,4 +525,36 @@ class SensorFusion(nn.Module):
         x = x + self.attn(self.ln1(x))
         x = x + self.fusion_mlp(self.ln2(x))
 
-        return x[:, -1, :]
\ No newline at end of file
+        return x[:, -1, :]
+
+    def forward_recurrent(self, lidar_inputs, state_inputs, state):
+        # "linear" mode, whole sequences at once
+        # lidar_x: (B, L, 6, R)
+        # state_x: (B, L, state_dim)
+        # state: (B, attn.state_size)
+        B, L = state_inputs.shape[:2]
+        x = self.embed(lidar_inputs.flatten(0, 1), state_inputs.flatten(0, 1)).reshape(B, L, -1)
+
+        y, state = self.attn(self.ln1(x), state)
+        x = x + y
+        x = x + self.fusion_mlp(self.ln2(x))
+
+        return x, state  # (B, L, embed)
+
+    def forward_parallel(self, lidar_inputs, state_inputs, past_tokens):
+        # "tokens" mode, whole sequences in one causal pass
+        # lidar_x: (B, L, 6, R)
+        # state_x: (B, L, state_dim)
+        # past_tokens: (B, T, embed), embed() outputs of the previous T steps
+        B, L = state_inputs.shape[:2]
+        tokens = self.embed(lidar_inputs.flatten(0, 1), state_inputs.flatten(0, 1)).reshape(B, L, -1)
+        return self.attend(tokens, past_tokens), tokens  # (B, L, embed) each
+
+    def attend(self, tokens, past_tokens):
+        # "tokens" mode attention + mlp over already embedded tokens
+        # tokens: (B, L, embed), past_tokens: (B, T, embed)
+        # Step t sees its T previous tokens, same window as one step at a time with past_tokens
+        x = torch.cat([past_tokens, tokens], dim=1)  # (B, T+L, embed)
+        x = tokens + self.attn(self.ln1(x), num_queries=tokens.size(1), window=past_tokens.size(1))
+        x = x + self.fusion_mlp(self.ln2(x))
+        return x
@@ -3,6 +3,7 @@ Custom Actor and Critic networks for ML-Agents PPO.
 Keep your custom network code here, separate from ml-agents source.
 """
 
+import os
 from typing import List, Dict, Any, Tuple, Optional, Union
 import numpy as np
 
@@ -18,7 +19,16 @@ from mlagents.trainers.torch_entities.decoders import ValueHeads
 from mlagents.trainers.trajectory import ObsUtil
 from mlagents.trainers.buffer import AgentBuffer
 
-from .models import LidarCnnConfig, StateMlpConfig, SensorFusionConfig, SensorFusion
+from .models import LidarCnnConfig, StateMlpConfig, SensorFusionConfig, SensorFusion, LidarDequantize, FUSION_MODES
+from .quantization import LidarQuantConfig, LidarQuantizer, compact_buffer
+
+
+class FusionModeError(Exception):
+    """
+    Checkpoint saved with another fusion mode.
+    Not a RuntimeError / ValueError, ml-agents' model saver would log those and train from scratch.
+    """
+
 
 class RunningNorm(nn.Module):
     def __init__(self, size: int, eps: float = 1e-5):
@@ -68,6 +78,8 @@ class Encoder(nn.Module):
             self,
             observation_specs: ObservationSpec,
             network_settings: NetworkSettings,
+            fusion_mode: Optional[str] = None,
+            lidar_quant: Optional[str] = None,
     ):
         assert network_settings.memory is not None, "SharedEncoder requires memory"
         super().__init__()
@@ -101,6 +113,10 @@ class Encoder(nn.Module):
         print(f"Lidar sensors: {self.lidar_indices} (total: {self.lidar_size})")
         print(f"State sensors: {self.state_indices} (total: {self.state_size})")
 
+        # Compact lidar storage (uint8 / float16 codes), dequantized in encode(..., lidar_codes=True)
+        self.lidar_quantizer: Optional[LidarQuantizer] = None
+        self.lidar_dequant: Optional[LidarDequantize] = None
+
         # State Normalizer
         self.normalize = network_settings.normalize
         self.state_norm = RunningNorm(self.state_size) if self.normalize else nn.Identity()
@@ -111,7 +127,7 @@ class Encoder(nn.Module):
         # TODO: expose these via network_settings or yaml
         self.context_length = network_settings.memory.sequence_length
         self.num_embeddings = network_settings.memory.memory_size
-        self._memory_size = self.context_length * self.num_embeddings
+        self.fusion_mode = fusion_mode or os.environ.get("CUSTOM_FUSION_MODE", "attention")
 
         lidar_config = LidarCnnConfig(
             in_channels=6,
@@ -132,14 +148,53 @@ class Encoder(nn.Module):
             block_size=self.context_length,
             attention_drop=0.1,
             residual_drop=0.1,
+            fusion_mode=self.fusion_mode,
         )
 
         self.sensor_fusion = SensorFusion(fusion_config)
+        # Saved with the weights, checked on load (the memory layout of "attention" and "tokens" is the same size)
+        self.fusion_mode_vector = nn.Parameter(torch.Tensor([FUSION_MODES.index(self.fusion_mode)]), requires_grad=False)
+
+        # "attention" keeps the last context_length outputs, "tokens" the last context_length
+        # pre-attention tokens, "linear" a fixed-size state
+        if self.fusion_mode == "linear":
+            self._memory_size = self.sensor_fusion.attn.state_size
+        else:
+            self._memory_size = self.context_length * self.num_embeddings
+        print(f"Fusion mode: {self.fusion_mode} (memory size {self._memory_size})")
+
+        # Detached output of the last grad-enabled (training) encode, reused by FusionCuriosityRewardProvider
+        self.last_training_encoding: Optional[torch.Tensor] = None
+
+        if lidar_quant:
+            self.enable_lidar_quant(lidar_quant)
+
+    def enable_lidar_quant(self, dtype: str) -> None:
+        """
+        Compact lidar storage, also on an already built encoder (quantization.install does that for the trainer's).
+        Adds no weights, checkpoints load the same with and without it.
+        """
+        self.lidar_quantizer = LidarQuantizer(LidarQuantConfig(dtype=dtype))
+        dequant = LidarDequantize(self.lidar_quantizer.scale, self.lidar_quantizer.offset)
+        self.lidar_dequant = dequant.to(self.fusion_mode_vector.device)
+        print(f"Using {dtype} lidar storage")
 
     @property
     def memory_size(self) -> int:
         return self._memory_size
 
+    def _load_from_state_dict(self, state_dict, prefix, *args, **kwargs):
+        key = prefix + "fusion_mode_vector"
+        if key not in state_dict:
+            state_dict[key] = torch.Tensor([FUSION_MODES.index("attention")])  # saved before the mode was
+        saved = FUSION_MODES[int(state_dict[key].item())]
+        if saved != self.fusion_mode:
+            raise FusionModeError(
+                f"checkpoint was trained with fusion mode {saved!r}, this network uses {self.fusion_mode!r} "
+                f"(set FUSION_MODE / CUSTOM_FUSION_MODE or pass fusion_mode={saved!r})"
+            )
+        super()._load_from_state_dict(state_dict, prefix, *args, **kwargs)
+
     def _memories_to_past_tokens(self, memories):
         # memories: (batch, 1, memory_size) -> (batch, context_length, num_embeddings)
         return memories.reshape(-1, self.context_length, self.num_embeddings)
@@ -159,20 +214,68 @@ class Encoder(nn.Module):
         state_x = torch.cat(parts, dim=1)  # (N, state_size)
         self.state_norm.update(state_x)
 
+    def compact_buffer(self, buffer: AgentBuffer) -> Dict[str, int]:
+        """
+        Quantize the lidar observations stored in buffer (see quantization.compact_buffer).
+        Observations read back from it must be encoded with lidar_codes=True, quantization.install
+        does both for the PPO update buffer.
+        """
+        assert self.lidar_quantizer is not None, "Encoder was built without lidar_quant"
+        return compact_buffer(buffer, self.lidar_indices, self.lidar_quantizer)
+
     def copy_normalization(self, other: "Encoder") -> None:
         if isinstance(self.state_norm, RunningNorm) and isinstance(other.state_norm, RunningNorm):
             self.state_norm.copy_from(other.state_norm)
 
+    def rollout_encodings(self, memories: torch.Tensor, chained: torch.Tensor) -> Optional[torch.Tensor]:
+        """
+        Encodings the policy computed during a rollout, read back from the stored input memories (N, memory_size)
+        of consecutive rows, without the LidarCnn. Row t (of N - 1) is valid where chained[t], i.e. row t + 1 is
+        the next step of the same trajectory. None for "linear", its state doesn't keep the encoding.
+        """
+        if self.fusion_mode == "linear":
+            return None
+        past = self._memories_to_past_tokens(memories)  # (N, C, embed)
+        newest = past[1:, -1]  # step t's output ("attention") or embed() token ("tokens")
+        if self.fusion_mode == "attention":
+            return newest
+
+        # "tokens": one causal pass per chunk of C steps with the first step's context,
+        # steps in chunks that cross a trajectory end get their own stored context instead
+        C, E = self.context_length, self.num_embeddings
+        m = newest.size(0) // C * C
+        encodings = torch.empty_like(newest)
+        encodings[:m] = self.sensor_fusion.attend(newest[:m].reshape(-1, C, E), past[0:m:C]).reshape(-1, E)
+        broken = torch.ones(newest.size(0), dtype=torch.bool, device=newest.device)
+        broken[:m] = (~chained[:m]).reshape(-1, C).any(dim=1).repeat_interleave(C)
+        rows = (broken & chained[:-1]).nonzero().squeeze(1)
+        if len(rows) > 0:
+            encodings[rows] = self.sensor_fusion.attend(newest[rows].unsqueeze(1), past[rows])[:, 0]
+        return encodings
+
+    def _record_training_encoding(self, encoding: torch.Tensor) -> None:
+        if torch.is_grad_enabled():
+            self.last_training_encoding = encoding.detach()
+
     def encode(
             self,
             inputs: List[torch.Tensor],
             memories: torch.Tensor,
             sequence_length: int = 1,
+            lidar_codes: bool = False,
     ) -> Tuple[torch.Tensor, torch.Tensor]:
         # Gather lidar -> (B, 6, R)
         lidar_obs = [inputs[i] for i in self.lidar_indices]
         lidar_x = torch.cat(lidar_obs, dim=1).squeeze(-1)  # has to be (B, C, R)
 
+        # lidar_codes: inputs are compact_buffer codes, in any dtype (list_to_tensor casts them to float32)
+        if lidar_codes:
+            if self.lidar_dequant is None:
+                raise ValueError("lidar_codes=True but the Encoder was built without lidar_quant")
+            lidar_x = self.lidar_dequant(lidar_x)
+        elif lidar_x.dtype != torch.float32:
+            raise TypeError(f"Lidar input is {lidar_x.dtype}, pass lidar_codes=True for quantized lidar")
+
         # Gather state -> (B, state_size)
         state_obs = [inputs[i].flatten(start_dim=1) for i in self.state_indices]
         state_x = torch.cat(state_obs, dim=1)
@@ -182,7 +285,23 @@ class Encoder(nn.Module):
         lidar_x = lidar_x.reshape(lidar_x.size(0) // sequence_length, sequence_length, *lidar_x.shape[1:])
         state_x = state_x.reshape(state_x.size(0) // sequence_length, sequence_length, -1)
 
+        if self.fusion_mode == "linear":
+            # Parallel over the sequence (recurrent when sequence_length == 1)
+            encoding, state = self.sensor_fusion.forward_recurrent(lidar_x, state_x, memories.reshape(-1, self._memory_size))
+            encoding = encoding.reshape(-1, self.num_embeddings)
+            self._record_training_encoding(encoding)
+            return encoding, state.unsqueeze(0)
+
         past_tokens = self._memories_to_past_tokens(memories)
+
+        if self.fusion_mode == "tokens":
+            # One causal pass over context + sequence (a single step when sequence_length == 1)
+            encoding, tokens = self.sensor_fusion.forward_parallel(lidar_x, state_x, past_tokens)
+            encoding = encoding.reshape(-1, self.num_embeddings)
+            self._record_training_encoding(encoding)
+            past_tokens = torch.cat([past_tokens, tokens], dim=1)[:, -self.context_length:]
+            return encoding, self._past_tokens_to_memories(past_tokens)
+
         encodings = []
 
         for t in range(sequence_length):
@@ -197,6 +316,7 @@ class Encoder(nn.Module):
         # Stack and flatten back to (B, embed)
         encoding = torch.stack(encodings, dim=1)  # (actual_batch, seq, embed)
         encoding = encoding.reshape(-1, self.num_embeddings)  # (B, embed)
+        self._record_training_encoding(encoding)
 
         # Update past tokens
         memories_out = self._past_tokens_to_memories(past_tokens)
@@ -217,9 +337,11 @@ class CustomActor(nn.Module, Actor):
             action_spec: ActionSpec,
             conditional_sigma: bool = False,
             tanh_squash: bool = False,
+            fusion_mode: Optional[str] = None,
+            lidar_quant: Optional[str] = None,
     ):
         super().__init__()
-        self.encoder = Encoder(observation_specs, network_settings)
+        self.encoder = Encoder(observation_specs, network_settings, fusion_mode, lidar_quant)
         self.encoding_size = self.encoder.num_embeddings
 
         self.action_spec = action_spec
@@ -276,11 +398,13 @@ class CustomActor(nn.Module, Actor):
         masks: Optional[torch.Tensor] = None,
         memories: Optional[torch.Tensor] = None,
         sequence_length: int = 1,
+        lidar_codes: bool = False,
     ) -> Dict[str, Any]:
         """
         TRAINING: Compute log_probs and entropy for actions already taken.
+        lidar_codes: inputs come from a compacted buffer (Encoder.compact_buffer)
         """
-        encoding, _ = self.encoder.encode(inputs, memories, sequence_length)
+        encoding, _ = self.encoder.encode(inputs, memories, sequence_length, lidar_codes)
 
         log_probs, entropy = self.action_model.evaluate(encoding, masks, actions)
 
@@ -333,9 +457,11 @@ class CustomCritic(nn.Module, Critic):
         observation_specs: ObservationSpec,
         network_settings: NetworkSettings,
         stream_names: List[str],
+        fusion_mode: Optional[str] = None,
+        lidar_quant: Optional[str] = None,
     ):
         super().__init__()
-        self.encoder = Encoder(observation_specs, network_settings)
+        self.encoder = Encoder(observation_specs, network_settings, fusion_mode, lidar_quant)
         self.value_heads = ValueHeads(stream_names, self.encoding_size)
 
     @property
@@ -351,8 +477,9 @@ class CustomCritic(nn.Module, Critic):
             inputs: List[torch.Tensor],
             memories: Optional[torch.Tensor] = None,
             sequence_length: int = 1,
+            lidar_codes: bool = False,
     ) -> Tuple[Dict[str, torch.Tensor], torch.Tensor]:
-        encoding, memories = self.encoder.encode(inputs, memories, sequence_length)
+        encoding, memories = self.encoder.encode(inputs, memories, sequence_length, lidar_codes)
 
         value_outputs = {
             name: head(encoding).squeeze(-1) for name, head in self.value_heads.items()
@@ -372,6 +499,8 @@ class CustomActorCritic(CustomActor, Critic):
             stream_names: List[str],
             conditional_sigma: bool = False,
             tanh_squash: bool = False,
+            fusion_mode: Optional[str] = None,
+            lidar_quant: Optional[str] = None,
     ):
         super().__init__(
             observation_specs,
@@ -379,6 +508,8 @@ class CustomActorCritic(CustomActor, Critic):
             action_spec,
             conditional_sigma,
             tanh_squash,
+            fusion_mode,
+            lidar_quant,
         )
         self.stream_names = stream_names
         self.value_heads = ValueHeads(stream_names, self.encoding_size)
@@ -388,6 +519,7 @@ class CustomActorCritic(CustomActor, Critic):
         inputs: List[torch.Tensor],
         memories: Optional[torch.Tensor] = None,
         sequence_length: int = 1,
+        lidar_codes: bool = False,
     ) -> Tuple[Dict[str, torch.Tensor], torch.Tensor]:
-        encoding, memories_out = self.encoder.encode(inputs, memories, sequence_length)
+        encoding, memories_out = self.encoder.encode(inputs, memories, sequence_length, lidar_codes)
         return self.value_heads(encoding), memories_out
@@ -0,0 +1,400 @@
+"""
+Dependency-free CustomActor inference (NumPy only, no torch / mlagents imports).
+Runs LidarCnn + StateMlp -> causal attention fusion -> deterministic action head on exported weights,
+export them with `Custom.checkpoint.export_numpy(actor, path)`.
+Every per-step array (GEMM outputs, layer norms, attention, tokens, outputs) lives in a preallocated workspace,
+only the per-row reductions (means, softmax max / sum, discrete argmax) allocate.
+"""
+
+import json
+import math
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+NUMPY_EXPORT_VERSION = 1
+META_KEY = "__meta__"
+
+_PREFIX = "encoder.sensor_fusion."
+_SQRT1_2 = 1.0 / math.sqrt(2.0)
+
+
+def _scratch(ws: Optional["_Workspace"], name: str, x: np.ndarray) -> np.ndarray:
+    return np.empty_like(x) if ws is None else ws.get(name, x.shape)
+
+
+def _gelu(x, ws=None):
+    """Exact (erf) GELU like nn.GELU(), in place"""
+    # numpy has no erf, Abramowitz & Stegun 7.1.26 (|err| < 1.5e-7) is well inside float32 parity:
+    # erf(|z|) = 1 - poly(t) * exp(-z^2) with z = x / sqrt(2), so gelu = relu(x) - 0.5 * |x| * poly * exp(-x^2 / 2)
+    a = np.abs(x, out=_scratch(ws, "act0", x))
+    t = np.multiply(a, 0.3275911 * _SQRT1_2, out=_scratch(ws, "act1", x))
+    t += 1.0
+    np.reciprocal(t, out=t)
+    poly = np.multiply(t, 1.061405429, out=_scratch(ws, "act2", x))
+    for c in (-1.453152027, 1.421413741, -0.284496736, 0.254829592):
+        poly += c
+        poly *= t
+    e = np.square(a, out=t)
+    e *= -0.5
+    np.exp(e, out=e)
+    poly *= e
+    poly *= a
+    poly *= 0.5
+    np.maximum(x, 0.0, out=x)
+    x -= poly
+    return x
+
+
+def _selu(x, ws=None):
+    alpha, scale = 1.6732632423543772, 1.0507009873554805
+    neg = np.minimum(x, 0.0, out=_scratch(ws, "act0", x))
+    np.expm1(neg, out=neg)
+    neg *= alpha
+    np.maximum(x, 0.0, out=x)
+    x += neg
+    x *= scale
+    return x
+
+
+def _silu(x, ws=None):
+    d = np.negative(x, out=_scratch(ws, "act0", x))
+    np.exp(d, out=d)
+    d += 1.0
+    x /= d
+    return x
+
+
+_ACTIVATIONS = {
+    "GELU": _gelu,
+    "ReLU": lambda x, ws=None: np.maximum(x, 0.0, out=x),
+    "Tanh": lambda x, ws=None: np.tanh(x, out=x),
+    "SiLU": _silu,
+    "SELU": _selu,
+}
+
+
+def _activation(name: Optional[str]):
+    if name is None:
+        return None
+    if name not in _ACTIVATIONS:
+        raise ValueError(f"Unsupported activation {name} (supported: {list(_ACTIVATIONS)})")
+    return _ACTIVATIONS[name]
+
+
+def _layer_norm(x: np.ndarray, weight: np.ndarray, bias: np.ndarray, eps: float, out: np.ndarray) -> np.ndarray:
+    centered = np.subtract(x, x.mean(axis=-1, keepdims=True), out=out)
+    var = np.einsum("...i,...i->...", centered, centered)[..., None]
+    var /= centered.shape[-1]
+    var += eps
+    centered /= np.sqrt(var, out=var)
+    centered *= weight
+    centered += bias
+    return centered
+
+
+class ActionOut(NamedTuple):
+    continuous: Optional[np.ndarray]  # (B, continuous_size)
+    discrete: Optional[np.ndarray]  # (B, num_branches) int64
+
+
+class _Conv(NamedTuple):
+    weight: np.ndarray  # (out, k * in), tap major to match the im2col rows
+    bias: np.ndarray  # (out, 1)
+    kernel_size: int
+    stride: int
+    padding: int
+    act: Optional[object]
+
+
+class _Linear(NamedTuple):
+    weight_t: np.ndarray  # (in, out)
+    bias: np.ndarray
+    act: Optional[object]
+
+    @property
+    def out_features(self) -> int:
+        return self.weight_t.shape[1]
+
+    def __call__(self, x, out=None, ws=None):
+        y = np.matmul(x, self.weight_t, out=out)
+        y += self.bias
+        return self.act(y, ws) if self.act is not None else y
+
+
+class _Workspace:
+    """Preallocated flat buffers, grown to the largest size seen and reshaped per call"""
+
+    def __init__(self):
+        self._buffers: Dict[str, np.ndarray] = {}
+
+    def get(self, name: str, shape: Tuple[int, ...]) -> np.ndarray:
+        size = math.prod(shape)
+        buf = self._buffers.get(name)
+        if buf is None or buf.size < size:
+            buf = np.empty(size, dtype=np.float32)
+            self._buffers[name] = buf
+        return buf[:size].reshape(shape)
+
+    def linear(self, name: str, layer: _Linear, x: np.ndarray) -> np.ndarray:
+        return layer(x, self.get(name, (*x.shape[:-1], layer.out_features)), self)
+
+
+class NumpyActor:
+    """
+    CustomActor inference in vectorized NumPy.
+    Matches `CustomActor.forward` (eval mode, deterministic actions) step by step, memories included.
+    Returned arrays are workspace views that alternate between two buffers: feeding memories back into the next
+    step is safe, copy anything that has to outlive the step after.
+    """
+
+    def __init__(self, arrays: Dict[str, np.ndarray], meta: Dict):
+        if meta.get("version") != NUMPY_EXPORT_VERSION:
+            raise ValueError(f"Unsupported export version {meta.get('version')}, expected {NUMPY_EXPORT_VERSION}")
+        w = {k: np.asarray(v, dtype=np.float32) for k, v in arrays.items()}
+        self.meta = meta
+
+        self.lidar_indices: List[int] = meta["lidar_indices"]
+        self.state_indices: List[int] = meta["state_indices"]
+        self.context_length: int = meta["context_length"]
+        self.num_embeddings: int = meta["num_embeddings"]
+        self.num_head: int = meta["num_head"]
+        self.head_size = self.num_embeddings // self.num_head
+        self.scale = np.float32(self.head_size ** -0.5)
+        self.ln_eps: float = meta["ln_eps"]
+
+        # State normalizer: (x - mean) * inv_std
+        self.normalize = meta["normalize"]
+        if self.normalize:
+            self.norm_mean = w["encoder.state_norm.mean"]
+            self.norm_inv_std = 1.0 / np.sqrt(w["encoder.state_norm.var"] + np.float32(meta["norm_eps"]))
+
+        # uint8 / fp16 lidar codes -> float32, see quantization.LidarQuantizer
+        quant = meta.get("lidar_quant")
+        self.lidar_scale = None if quant is None else np.asarray(quant["scale"], np.float32)[:, None]
+        self.lidar_offset = None if quant is None else np.asarray(quant["offset"], np.float32)[:, None]
+
+        self.conv = self._compile_conv(w, meta["lidar_cnn"])
+        self.state_mlp = self._compile_linears(w, meta["state_mlp"])
+        self.lidar_proj = self._linear(w, _PREFIX + "lidar_proj")
+        self.state_proj = self._linear(w, _PREFIX + "state_proj")
+        self.pool = self._linear(w, _PREFIX + "pool.0", meta["pool_act"])
+
+        self.ln1 = (w[_PREFIX + "ln1.weight"], w[_PREFIX + "ln1.bias"])
+        self.ln2 = (w[_PREFIX + "ln2.weight"], w[_PREFIX + "ln2.bias"])
+        self.key = self._linear(w, _PREFIX + "attn.key")
+        self.query = self._linear(w, _PREFIX + "attn.query")
+        self.value = self._linear(w, _PREFIX + "attn.value")
+        self.proj = self._linear(w, _PREFIX + "attn.proj")
+        self.fusion_mlp = [
+            self._linear(w, _PREFIX + "fusion_mlp.0", meta["fusion_act"]),
+            self._linear(w, _PREFIX + "fusion_mlp.2"),
+        ]
+
+        # Deterministic action head
+        self.continuous_size: int = meta["continuous_size"]
+        self.discrete_branches: List[int] = meta["discrete_branches"]
+        self.clip_action: bool = meta["clip_action"]
+        self.mu = self._linear(w, "action_model._continuous_distribution.mu") if self.continuous_size > 0 else None
+        self.branches = [
+            self._linear(w, f"action_model._discrete_distribution.branches.{i}")
+            for i in range(len(self.discrete_branches))
+        ]
+
+        self._ws = _Workspace()
+        self._parity = 0  # which of the two output buffers this step writes
+
+    @classmethod
+    def load(cls, path: str) -> "NumpyActor":
+        with np.load(path, allow_pickle=False) as data:
+            meta = json.loads(str(data[META_KEY]))
+            arrays = {k: data[k] for k in data.files if k != META_KEY}
+        return cls(arrays, meta)
+
+    @staticmethod
+    def _linear(w, name: str, act: Optional[str] = None) -> _Linear:
+        return _Linear(np.ascontiguousarray(w[name + ".weight"].T), w[name + ".bias"], _activation(act))
+
+    @classmethod
+    def _compile_linears(cls, w, program: List[Dict]) -> List[_Linear]:
+        layers = []
+        for op in program:
+            if op["op"] == "linear":
+                layers.append(cls._linear(w, op["name"]))
+            elif op["op"] == "act":
+                layers[-1] = layers[-1]._replace(act=_activation(op["name"]))
+            else:
+                raise ValueError(f"Unexpected op {op['op']} in mlp program")
+        return layers
+
+    @staticmethod
+    def _compile_conv(w, program: List[Dict]) -> List[_Conv]:
+        layers = []
+        for op in program:
+            if op["op"] == "conv1d":
+                weight = w[op["name"] + ".weight"]  # (out, in, k)
+                bias = w.get(op["name"] + ".bias", np.zeros(weight.shape[0], np.float32))
+                layers.append([weight, bias, op["stride"], op["padding"], None])
+            elif op["op"] == "batchnorm":
+                # fold eval-mode BatchNorm into the preceding conv
+                weight, bias = layers[-1][0], layers[-1][1]
+                gamma = w[op["name"] + ".weight"] / np.sqrt(w[op["name"] + ".running_var"] + np.float32(op["eps"]))
+                layers[-1][0] = weight * gamma[:, None, None]
+                layers[-1][1] = (bias - w[op["name"] + ".running_mean"]) * gamma + w[op["name"] + ".bias"]
+            elif op["op"] == "act":
+                layers[-1][4] = _activation(op["name"])
+            else:
+                raise ValueError(f"Unexpected op {op['op']} in conv program")
+
+        return [
+            _Conv(np.ascontiguousarray(weight.transpose(0, 2, 1).reshape(weight.shape[0], -1)),
+                  bias.astype(np.float32)[:, None], weight.shape[2], stride, padding, act)
+            for weight, bias, stride, padding, act in layers
+        ]
+
+    @property
+    def memory_size(self) -> int:
+        return self.context_length * self.num_embeddings
+
+    def initial_memories(self, batch: int) -> np.ndarray:
+        return np.zeros((batch, self.memory_size), dtype=np.float32)
+
+    def _lidar_features(self, lidar_x: np.ndarray) -> Tuple[np.ndarray, int]:
+        """LidarCnn summed over rays -> (B, out), number of rays"""
+        # Channels lead, (C, B, R), so each conv is one (out, k*C) x (k*C, B*R) GEMM over an im2col buffer
+        B = lidar_x.shape[0]
+        h = lidar_x.transpose(1, 0, 2)
+        for i, layer in enumerate(self.conv):
+            C, _, R = h.shape
+            k, p, s = layer.kernel_size, layer.padding, layer.stride
+            r_out = (R + 2 * p - k) // s + 1
+
+            padded = self._ws.get(f"pad{i}", (C, B, R + 2 * p))
+            padded[:, :, :p] = 0.0
+            padded[:, :, p + R:] = 0.0
+            padded[:, :, p:p + R] = h
+
+            cols = self._ws.get(f"cols{i}", (k, C, B, r_out))
+            for j in range(k):
+                cols[j] = padded[:, :, j:j + s * (r_out - 1) + 1:s]
+
+            out = self._ws.get(f"conv{i}", (layer.weight.shape[0], B * r_out))
+            np.matmul(layer.weight, cols.reshape(k * C, B * r_out), out=out)
+            out += layer.bias
+            if layer.act is not None:
+                layer.act(out, self._ws)
+            h = out.reshape(-1, B, r_out)
+        feat_sum = np.sum(h, axis=2, out=self._ws.get("feat_sum", h.shape[:2]))
+        return feat_sum.T, h.shape[2]
+
+    def encode(
+            self,
+            inputs: Sequence[np.ndarray],
+            memories: Optional[np.ndarray] = None,
+            lidar_codes: bool = False,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """One rollout step -> (encoding (B, embed), memories_out (B, memory_size))"""
+        ws, out = self._ws, f"out{self._parity}"
+        B = np.shape(inputs[self.lidar_indices[0]])[0]
+
+        # Gather lidar -> (B, 6, R)
+        lidar_parts = [np.asarray(inputs[i]).reshape(B, -1) for i in self.lidar_indices]
+        codes_dtype = next((p.dtype for p in lidar_parts if p.dtype in (np.uint8, np.float16)), None)
+        # lidar_codes: quantization codes in any dtype, see Encoder.encode
+        if lidar_codes and self.lidar_scale is None:
+            raise ValueError("lidar_codes=True but the model was exported without lidar_quant")
+        if not lidar_codes and codes_dtype is not None:
+            raise TypeError(f"Lidar input is {codes_dtype}, pass lidar_codes=True for quantized lidar")
+        lidar_x = ws.get("lidar", (B, sum(p.shape[1] for p in lidar_parts)))
+        np.concatenate(lidar_parts, axis=1, out=lidar_x)
+        lidar_x = lidar_x.reshape(B, sum(np.shape(inputs[i])[1] for i in self.lidar_indices), -1)
+        if lidar_codes:
+            lidar_x *= self.lidar_scale
+            lidar_x += self.lidar_offset
+
+        # Gather state -> (B, state_size)
+        state_parts = [np.asarray(inputs[i], dtype=np.float32).reshape(B, -1) for i in self.state_indices]
+        state_x = ws.get("state", (B, sum(p.shape[1] for p in state_parts)))
+        np.concatenate(state_parts, axis=1, out=state_x)
+        if self.normalize:
+            state_x -= self.norm_mean
+            state_x *= self.norm_inv_std
+
+        # State pathway
+        s_out = state_x
+        for i, layer in enumerate(self.state_mlp):
+            s_out = ws.linear(f"state_mlp{i}", layer, s_out)
+        s_out = ws.linear("state_proj", self.state_proj, s_out)
+
+        # Lidar pathway, the token mean is linear so project the summed ray features once instead of every ray
+        feat_sum, num_rays = self._lidar_features(lidar_x)
+        l_sum = np.matmul(feat_sum, self.lidar_proj.weight_t, out=ws.get("lidar_proj", s_out.shape))
+        l_sum += num_rays * self.lidar_proj.bias
+        l_sum += s_out
+        l_sum /= np.float32(num_rays + 1)
+        x = ws.linear("pool", self.pool, l_sum)
+
+        # Context tokens (B, T+1, embed)
+        T, E = self.context_length, self.num_embeddings
+        if memories is None:
+            memories = self.initial_memories(B)
+        tokens = ws.get("tokens", (B, T + 1, E))
+        tokens[:, :T] = np.asarray(memories, dtype=np.float32).reshape(B, T, E)
+        tokens[:, T] = x
+
+        # Causal attention, only the last token is returned so only its query / mlp are needed
+        ln = _layer_norm(tokens, *self.ln1, self.ln_eps, out=ws.get("ln1", tokens.shape))
+        nh, hs = self.num_head, self.head_size
+        k = ws.linear("key", self.key, ln).reshape(B, T + 1, nh, hs).transpose(0, 2, 3, 1)  # (B, nh, hs, T+1)
+        v = ws.linear("value", self.value, ln).reshape(B, T + 1, nh, hs).transpose(0, 2, 1, 3)  # (B, nh, T+1, hs)
+        q = ws.linear("query", self.query, ln[:, T]).reshape(B, nh, 1, hs)
+
+        attention = np.matmul(q, k, out=ws.get("attention", (B, nh, 1, T + 1)))
+        attention *= self.scale
+        attention -= attention.max(axis=-1, keepdims=True)
+        np.exp(attention, out=attention)
+        attention /= attention.sum(axis=-1, keepdims=True)
+        y = np.matmul(attention, v, out=ws.get("attention_out", (B, nh, 1, hs))).reshape(B, E)
+
+        enc = np.add(tokens[:, T], ws.linear("proj", self.proj, y), out=ws.get(out + "enc", (B, E)))
+        h = _layer_norm(enc, *self.ln2, self.ln_eps, out=ws.get("ln2", enc.shape))
+        for i, layer in enumerate(self.fusion_mlp):
+            h = ws.linear(f"fusion_mlp{i}", layer, h)
+        enc += h
+
+        memories_out = ws.get(out + "memories", (B, T, E))
+        memories_out[:, :T - 1] = tokens[:, 1:T]
+        memories_out[:, T - 1] = enc
+        self._parity ^= 1
+        return enc, memories_out.reshape(B, T * E)
+
+    def act(
+            self,
+            inputs: Sequence[np.ndarray],
+            memories: Optional[np.ndarray] = None,
+            masks: Optional[np.ndarray] = None,
+            lidar_codes: bool = False,
+    ) -> Tuple[ActionOut, np.ndarray]:
+        """Deterministic actions (same as the exported ONNX deterministic outputs) and updated memories"""
+        out = f"out{self._parity}"  # same buffers as this step's encode
+        enc, memories_out = self.encode(inputs, memories, lidar_codes)
+
+        continuous = None
+        if self.mu is not None:
+            continuous = self._ws.linear(out + "continuous", self.mu, enc)
+            if self.clip_action:
+                np.clip(continuous, -3.0, 3.0, out=continuous)
+                continuous /= 3.0
+
+        discrete = None
+        if self.branches:
+            picks, offset = [], 0
+            for branch, size in zip(self.branches, self.discrete_branches):
+                logits = self._ws.linear("logits", branch, enc)
+                if masks is not None:
+                    logits[np.asarray(masks)[:, offset:offset + size] == 0] = -np.inf
+                picks.append(logits.argmax(axis=1))
+                offset += size
+            discrete = np.stack(picks, axis=1)
+
+        return ActionOut(continuous, discrete), memories_out
@@ -0,0 +1,327 @@
+"""
+Local dynamic-batching inference server for CustomActor, for evaluation / deployment rollouts.
+Not a stand-in for the trainer's inference: responses carry actions only, no log probs or memories for PPO.
+Env workers send small per-step requests over a Unix socket, the server coalesces whatever arrives within
+`max_wait_ms` (up to `max_batch` agents) into one forward of a single actor copy and keeps memories per agent.
+"""
+
+import copy
+import json
+import os
+import queue
+import socket
+import struct
+import threading
+import time
+import warnings
+from typing import Dict, List, NamedTuple, Optional, Sequence
+
+import numpy as np
+from mlagents.torch_utils import torch, nn
+from mlagents_envs import logging_util
+
+from .numpy_inference import ActionOut
+
+logger = logging_util.get_logger(__name__)
+
+# request: num_agents, reserved | agent ids (int64), obs (float32, spec order), episode_start (uint8)
+_REQUEST = struct.Struct("<II")
+# response: num_agents, weights version | continuous (float32), discrete (int32)
+#       or: _ERROR, message length | utf-8 message, when the batch failed
+_RESPONSE = struct.Struct("<II")
+_ERROR = 0xFFFFFFFF
+_HANDSHAKE = struct.Struct("<I")
+
+
+def _recv_exact(conn: socket.socket, view: memoryview) -> bool:
+    """Fill view from conn, False if the peer closed"""
+    while len(view):
+        n = conn.recv_into(view)
+        if n == 0:
+            return False
+        view = view[n:]
+    return True
+
+
+class _Request(NamedTuple):
+    conn: socket.socket
+    agent_ids: np.ndarray
+    episode_start: np.ndarray
+    obs: List[np.ndarray]
+
+
+class PolicyServer:
+    """
+    Holds one copy of the actor weights and a memory row per agent id, on the CPU whatever the default device is.
+    update_weights(state_dict) swaps in new weights (e.g. a newer checkpoint) between batches.
+    A batch that raises is answered with an error response to each of its workers, the server keeps serving.
+    """
+
+    def __init__(self, actor: nn.Module, socket_path: str, max_batch: int = 1024, max_wait_ms: float = 2.0):
+        self.actor = copy.deepcopy(actor).cpu().eval().requires_grad_(False)
+        # storage-free copy, update_weights loads into it so bad weights raise on the caller's thread
+        self._validator = copy.deepcopy(self.actor).to("meta")
+        self.socket_path = socket_path
+        self.max_batch = max_batch  # agents, 1 = every request on its own
+        self.max_wait = max_wait_ms / 1e3
+
+        encoder = self.actor.encoder
+        self.obs_shapes = [tuple(spec.shape) for spec in encoder.observation_specs]
+        self.memory_size = self.actor.memory_size
+        self.continuous_size = self.actor.action_spec.continuous_size
+        self.discrete_size = self.actor.action_spec.discrete_size
+
+        # agent id -> row of self._memories
+        self._rows: Dict[int, int] = {}
+        self._memories = torch.zeros(64, self.memory_size, device="cpu")
+
+        self._pending_weights: Optional[Dict[str, torch.Tensor]] = None
+        self._weights_lock = threading.Lock()
+        self.weights_version = 0
+
+        self._requests: "queue.Queue[_Request]" = queue.Queue()
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._sock: Optional[socket.socket] = None
+        self.num_batches = 0
+        self.num_agents = 0
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def start(self) -> None:
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.bind(self.socket_path)
+        self._sock.listen()
+        self._sock.settimeout(0.1)
+        for target in (self._accept_loop, self._batch_loop):
+            thread = threading.Thread(target=target, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self) -> None:
+        self._stop.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads.clear()
+        self._sock.close()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+    def update_weights(self, state_dict: Dict[str, torch.Tensor]) -> None:
+        """
+        Hot swap, copied now and loaded before the next batch.
+        Missing / unexpected keys, shape mismatches and FusionModeError raise here, nothing is queued.
+        """
+        with warnings.catch_warnings():
+            warnings.filterwarnings("ignore", message=".*meta parameter.*")  # no storage to copy into, by design
+            self._validator.load_state_dict(state_dict)
+        pending = {k: v.detach().to("cpu", copy=True) for k, v in state_dict.items()}
+        with self._weights_lock:
+            self._pending_weights = pending
+
+    # Connections
+
+    def _accept_loop(self) -> None:
+        meta = json.dumps({
+            "obs_shapes": self.obs_shapes,
+            "continuous_size": self.continuous_size,
+            "discrete_size": self.discrete_size,
+        }).encode()
+        while not self._stop.is_set():
+            try:
+                conn, _ = self._sock.accept()
+            except socket.timeout:
+                continue
+            conn.settimeout(None)
+            conn.sendall(_HANDSHAKE.pack(len(meta)) + meta)
+            thread = threading.Thread(target=self._read_loop, args=(conn,), daemon=True)
+            thread.start()
+
+    def _read_loop(self, conn: socket.socket) -> None:
+        header = bytearray(_REQUEST.size)
+        obs_sizes = [int(np.prod(shape)) * 4 for shape in self.obs_shapes]
+        with conn:
+            try:
+                while _recv_exact(conn, memoryview(header)):
+                    n, _ = _REQUEST.unpack(header)
+                    payload = bytearray(n * (8 + 1 + sum(obs_sizes)))
+                    if not _recv_exact(conn, memoryview(payload)):
+                        return
+
+                    agent_ids = np.frombuffer(payload, dtype=np.int64, count=n)
+                    offset = n * 8
+                    obs = []
+                    for shape, size in zip(self.obs_shapes, obs_sizes):
+                        obs.append(np.frombuffer(payload, dtype=np.float32, count=n * size // 4, offset=offset).reshape(n, *shape))
+                        offset += n * size
+                    episode_start = np.frombuffer(payload, dtype=np.uint8, count=n, offset=offset)
+                    self._requests.put(_Request(conn, agent_ids, episode_start, obs))
+            except OSError:
+                pass  # worker went away
+
+    # Batching
+
+    def _collect(self) -> List[_Request]:
+        try:
+            batch = [self._requests.get(timeout=0.1)]
+        except queue.Empty:
+            return []
+        agents = len(batch[0].agent_ids)
+        deadline = time.perf_counter() + self.max_wait
+        while agents < self.max_batch:
+            timeout = deadline - time.perf_counter()
+            try:
+                request = self._requests.get(timeout=timeout) if timeout > 0 else self._requests.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(request)
+            agents += len(request.agent_ids)
+        return batch
+
+    def _memory_rows(self, agent_ids: np.ndarray, episode_start: np.ndarray) -> torch.Tensor:
+        rows = []
+        for agent_id in agent_ids.tolist():
+            row = self._rows.get(agent_id)
+            if row is None:
+                row = self._rows[agent_id] = len(self._rows)
+                if row >= len(self._memories):
+                    self._memories = torch.cat([self._memories, torch.zeros_like(self._memories)])
+                self._memories[row] = 0.0
+            rows.append(row)
+        rows = torch.as_tensor(rows, dtype=torch.long, device="cpu")
+        if episode_start.any():
+            self._memories[rows[torch.from_numpy(episode_start.astype(bool))]] = 0.0
+        return rows
+
+    def _swap_weights(self) -> None:
+        with self._weights_lock:
+            pending, self._pending_weights = self._pending_weights, None
+        if pending is not None:
+            self.actor.load_state_dict(pending)
+            self.weights_version += 1
+
+    @torch.no_grad()
+    def _batch_loop(self) -> None:
+        with torch.device("cpu"):  # the trainer sets a CUDA default device, tensors made inside the actor too
+            self._serve()
+
+    def _serve(self) -> None:
+        while not self._stop.is_set():
+            batch = self._collect()
+            if not batch:
+                continue
+            try:
+                self._run_batch(batch)
+            except Exception as e:
+                logger.exception("PolicyServer batch of %d requests failed", len(batch))
+                message = f"{type(e).__name__}: {e}".encode()
+                for request in batch:
+                    self._send(request.conn, _RESPONSE.pack(_ERROR, len(message)) + message)
+
+    def _run_batch(self, batch: List[_Request]) -> None:
+        self._swap_weights()
+
+        if len(batch) == 1:
+            agent_ids, episode_start, obs = batch[0].agent_ids, batch[0].episode_start, batch[0].obs
+        else:
+            agent_ids = np.concatenate([r.agent_ids for r in batch])
+            episode_start = np.concatenate([r.episode_start for r in batch])
+            obs = [np.concatenate(parts) for parts in zip(*(r.obs for r in batch))]
+
+        rows = self._memory_rows(agent_ids, episode_start)
+        inputs = [torch.from_numpy(o) for o in obs]
+        _, run_out, memories = self.actor.get_action_and_stats(inputs, memories=self._memories[rows].unsqueeze(0))
+        self._memories[rows] = memories.squeeze(0)
+
+        action = run_out["env_action"]
+        start = 0
+        for request in batch:
+            end = start + len(request.agent_ids)
+            parts = [_RESPONSE.pack(end - start, self.weights_version)]
+            if self.continuous_size > 0:
+                parts.append(np.ascontiguousarray(action.continuous[start:end], dtype=np.float32).tobytes())
+            if self.discrete_size > 0:
+                parts.append(np.ascontiguousarray(action.discrete[start:end], dtype=np.int32).tobytes())
+            self._send(request.conn, b"".join(parts))
+            start = end
+
+        self.num_batches += 1
+        self.num_agents += len(agent_ids)
+
+    @staticmethod
+    def _send(conn: socket.socket, data: bytes) -> None:
+        try:
+            conn.sendall(data)
+        except OSError:
+            pass  # worker went away, its reader thread closes the connection
+
+
+class PolicyClient:
+    """
+    One per env worker, blocking act() calls.
+    Agent ids only need to be unique within the worker, they are combined with worker_id on the wire.
+    timeout (seconds) bounds every socket operation, act() then raises socket.timeout instead of blocking
+    and closes the connection (a late response would be read as the next one's).
+    act() raises RuntimeError with the server's message when its batch failed.
+    """
+
+    def __init__(self, socket_path: str, worker_id: int = 0, timeout: Optional[float] = None):
+        self.worker_id = worker_id
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.settimeout(timeout)
+        self._sock.connect(socket_path)
+
+        size = bytearray(_HANDSHAKE.size)
+        _recv_exact(self._sock, memoryview(size))
+        meta = bytearray(_HANDSHAKE.unpack(size)[0])
+        _recv_exact(self._sock, memoryview(meta))
+        meta = json.loads(bytes(meta))
+        self.obs_shapes = [tuple(shape) for shape in meta["obs_shapes"]]
+        self.continuous_size = meta["continuous_size"]
+        self.discrete_size = meta["discrete_size"]
+        self.weights_version = 0
+        self._header = bytearray(_RESPONSE.size)
+
+    def close(self) -> None:
+        self._sock.close()
+
+    def act(
+        self,
+        agent_ids: Sequence[int],
+        obs: Sequence[np.ndarray],
+        episode_start: Optional[np.ndarray] = None,
+    ) -> ActionOut:
+        """obs: one (num_agents, *shape) array per observation spec; episode_start resets those agents' memories"""
+        n = len(agent_ids)
+        ids = (np.int64(self.worker_id) << 32) | np.asarray(agent_ids, dtype=np.int64)
+        if episode_start is None:
+            episode_start = np.zeros(n, dtype=np.uint8)
+        parts = [_REQUEST.pack(n, 0), ids.tobytes()]
+        parts += [np.ascontiguousarray(o, dtype=np.float32).tobytes() for o in obs]
+        parts.append(np.asarray(episode_start, dtype=np.uint8).tobytes())
+        try:
+            self._sock.sendall(b"".join(parts))
+            if not _recv_exact(self._sock, memoryview(self._header)):
+                raise ConnectionError("PolicyServer closed the connection")
+            count, version = _RESPONSE.unpack(self._header)
+            if count == _ERROR:
+                message = bytearray(version)
+                _recv_exact(self._sock, memoryview(message))
+                raise RuntimeError(f"PolicyServer batch failed: {message.decode()}")
+            payload = bytearray(n * 4 * (self.continuous_size + self.discrete_size))
+            _recv_exact(self._sock, memoryview(payload))
+        except socket.timeout:
+            self.close()
+            raise
+        self.weights_version = version
+
+        continuous = np.frombuffer(payload, dtype=np.float32, count=n * self.continuous_size).reshape(n, -1)
+        discrete = np.frombuffer(payload, dtype=np.int32, offset=n * self.continuous_size * 4).reshape(n, -1)
+        return ActionOut(continuous, discrete.astype(np.int64))
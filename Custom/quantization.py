@@ -0,0 +1,142 @@
+"""
+Compact lidar observation storage: uint8 / fp16 codes with per-channel scale and offset.
+The buffer side here is numpy only, the matching dequantization runs in `Encoder.encode(..., lidar_codes=True)`
+(models.LidarDequantize) just before the LidarCnn. install() wires both into the PPO trainer.
+"""
+
+from dataclasses import dataclass
+from typing import Dict, Sequence, Union
+
+import numpy as np
+
+QUANT_DTYPES = {"uint8": np.uint8, "float16": np.float16}
+
+
+@dataclass
+class LidarQuantConfig:
+    dtype: str = "uint8"
+    # Known value range per channel. SpatialLidarSensor writes 1 - distance / maxDistance, so [0, 1];
+    # use [0, maxDistance] for raw distances
+    low: Union[float, Sequence[float]] = 0.0
+    high: Union[float, Sequence[float]] = 1.0
+    num_channels: int = 6
+
+
+class LidarQuantizer:
+    """x ~= codes * scale + offset per channel, channels on axis -3 (obs are (..., C, R, 1))"""
+
+    def __init__(self, config: LidarQuantConfig):
+        if config.dtype not in QUANT_DTYPES:
+            raise ValueError(f"Unknown lidar quantization dtype {config.dtype}, expected one of {list(QUANT_DTYPES)}")
+        self.config = config
+        self.dtype = np.dtype(QUANT_DTYPES[config.dtype])
+
+        low = np.broadcast_to(np.asarray(config.low, dtype=np.float32), (config.num_channels,))
+        high = np.broadcast_to(np.asarray(config.high, dtype=np.float32), (config.num_channels,))
+        levels = 255.0 if self.dtype == np.uint8 else 1.0  # fp16 stores the range mapped to [0, 1]
+        self.scale = ((high - low) / levels).astype(np.float32)
+        self.offset = low.astype(np.float32).copy()
+        # broadcast over (C, R, 1)
+        self._scale = self.scale[:, None, None]
+        self._offset = self.offset[:, None, None]
+
+    def quantize(self, x: np.ndarray) -> np.ndarray:
+        codes = (np.asarray(x, dtype=np.float32) - self._offset) / self._scale
+        if self.dtype == np.uint8:
+            return np.clip(np.rint(codes), 0, 255).astype(np.uint8)
+        return codes.astype(np.float16)
+
+    def dequantize(self, codes: np.ndarray) -> np.ndarray:
+        x = codes.astype(np.float32)
+        x *= self._scale
+        x += self._offset
+        return x
+
+
+def compact_buffer(buffer, obs_indices: Sequence[int], quantizer: LidarQuantizer) -> Dict[str, int]:
+    """
+    Quantize the given observation fields (and their next_obs) of an AgentBuffer in place.
+    Only the entries appended since the last call are converted (scanning back from the end), so a buffer
+    that grows by appends can be compacted after each one.
+    Everything that encodes obs read back from the buffer has to pass `lidar_codes=True` to `Encoder.encode`,
+    stock ml-agents doesn't, use install() for the PPO update buffer.
+    Returns the float32 and compact sizes of the entries converted by this call in bytes.
+    """
+    from mlagents.trainers.trajectory import ObsUtil
+
+    float32_bytes, compact_bytes = 0, 0
+    for i in obs_indices:
+        for key in (ObsUtil.get_name_at(i), ObsUtil.get_name_at_next(i)):
+            if key not in buffer:
+                continue
+            field = buffer[key]
+            start = len(field)
+            while start > 0 and field[start - 1].dtype != quantizer.dtype:  # incl. float32 sequence padding
+                start -= 1
+            for j in range(start, len(field)):
+                obs = quantizer.quantize(field[j])
+                field[j] = obs
+                float32_bytes += obs.size * 4
+                compact_bytes += obs.nbytes
+    return {"float32_bytes": float32_bytes, "compact_bytes": compact_bytes}
+
+
+def install(dtype: str) -> None:
+    """
+    Keep the lidar observations of the PPO update buffer as `dtype` codes (Custom.learn --lidar-quant).
+    Patches ml-agents' PPOTrainer for this process, call before the trainers are created:
+    - add_policy turns on the quantizer of the actor and critic encoders (Encoder.enable_lidar_quant)
+    - every trajectory appended to the update buffer is compacted (Encoder.compact_buffer, new rows only)
+    - the update passes lidar_codes=True to actor.get_stats, critic.critic_pass and FusionCuriosity's update;
+      other reward signals that read observations in their update (gail, rnd, stock curiosity) raise ValueError
+    Value estimates and rewards are computed on the float32 trajectory before it's appended.
+    """
+    import functools
+
+    from mlagents.trainers.ppo.trainer import PPOTrainer
+    from mlagents.trainers.torch_entities.components.reward_providers import ExtrinsicRewardProvider
+
+    from .curiosity import FusionCuriosityRewardProvider
+
+    add_policy = PPOTrainer.add_policy
+    append_to_update_buffer = PPOTrainer._append_to_update_buffer
+    update_policy = PPOTrainer._update_policy
+
+    def add_policy_with_lidar_quant(self, parsed_behavior_id, policy) -> None:
+        encoder = getattr(policy.actor, "encoder", None)
+        if encoder is None:
+            raise TypeError(f"--lidar-quant needs a CustomActor policy, got {type(policy.actor).__name__}")
+        encoder.enable_lidar_quant(dtype)  # before the optimizer, so FusionCuriosity's snapshot has it too
+        add_policy(self, parsed_behavior_id, policy)
+
+        critic_encoder = getattr(self.optimizer.critic, "encoder", None)
+        if critic_encoder is None:
+            raise TypeError(f"--lidar-quant needs a CustomCritic, got {type(self.optimizer.critic).__name__}")
+        if critic_encoder is not encoder:
+            critic_encoder.enable_lidar_quant(dtype)
+        for name, signal in self.optimizer.reward_signals.items():
+            if isinstance(signal, FusionCuriosityRewardProvider):
+                signal.lidar_codes = True
+            elif not isinstance(signal, ExtrinsicRewardProvider):
+                raise ValueError(
+                    f"--lidar-quant: the {name} reward signal reads float32 observations from the update buffer "
+                    f"(use extrinsic and CURIOSITY=fusion only)"
+                )
+
+    def append_and_compact(self, agentbuffer_trajectory) -> None:
+        append_to_update_buffer(self, agentbuffer_trajectory)
+        self.policy.actor.encoder.compact_buffer(self.update_buffer)
+
+    def update_policy_on_codes(self) -> bool:
+        # TorchPPOOptimizer.update calls these without lidar_codes, shadow them for the update only
+        actor, critic = self.policy.actor, self.optimizer.critic
+        actor.get_stats = functools.partial(actor.get_stats, lidar_codes=True)
+        critic.critic_pass = functools.partial(critic.critic_pass, lidar_codes=True)
+        try:
+            return update_policy(self)
+        finally:
+            del actor.get_stats, critic.critic_pass
+
+    PPOTrainer.add_policy = add_policy_with_lidar_quant
+    PPOTrainer._append_to_update_buffer = append_and_compact
+    PPOTrainer._update_policy = update_policy_on_codes
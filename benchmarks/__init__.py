@@ -0,0 +1,4 @@
+"""
+Benchmarks for the custom networks.
+Run from the project root: PYTHONPATH=. uv run python -m benchmarks.<name>
+"""
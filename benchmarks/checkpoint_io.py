@@ -0,0 +1,97 @@
+"""
+Checkpoint load latency / RSS: torch.load + fresh CustomActor vs mmap / safetensors into a reused skeleton.
+Writes a fake run of `--num` ml-agents style checkpoints to a temp dir.
+
+PYTHONPATH=. uv run python -m benchmarks.checkpoint_io --num 20
+"""
+
+import argparse
+import gc
+import os
+import tempfile
+import time
+
+from mlagents.torch_utils import torch
+
+from Custom.checkpoint import (
+    CheckpointLoader, build_actor, build_critic, export_safetensors, list_checkpoints, POLICY_KEY, CRITIC_KEY,
+)
+from benchmarks.common import (
+    drone_observation_specs, drone_network_settings, drone_action_spec, rss_mb, print_table,
+)
+
+
+def write_fake_run(run_dir, num, specs, settings, action_spec):
+    # Same layout/keys as mlagents' TorchModelSaver.save_checkpoint
+    actor = build_actor(specs, settings, action_spec)
+    critic = build_critic(specs, settings, ["extrinsic", "curiosity"])
+    optimizer = torch.optim.Adam(list(actor.parameters()) + list(critic.parameters()))
+    behavior_dir = os.path.join(run_dir, "DroneAgent")
+    os.makedirs(behavior_dir, exist_ok=True)
+    for i in range(num):
+        step = (i + 1) * 250000
+        state = {
+            POLICY_KEY: actor.state_dict(),
+            "global_step": {"_GlobalSteps__global_step": torch.tensor([step])},
+            "Optimizer:value_optimizer": optimizer.state_dict(),
+            CRITIC_KEY: critic.state_dict(),
+        }
+        path = os.path.join(behavior_dir, f"DroneAgent-{step}.pt")
+        torch.save(state, path)
+        export_safetensors(path)
+
+
+def run_case(name, paths, load_fn):
+    gc.collect()
+    rss_before = rss_mb()
+    rss_peak = rss_before
+    elapsed = 0.0
+    for path in paths:
+        start = time.perf_counter()
+        load_fn(path)
+        elapsed += time.perf_counter() - start
+        rss_peak = max(rss_peak, rss_mb())  # sampled outside the timed region
+    elapsed *= 1e3
+    return {
+        "case": name,
+        "total_ms": elapsed,
+        "per_ckpt_ms": elapsed / len(paths),
+        "rss_peak_delta_mb": rss_peak - rss_before,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num", type=int, default=20)
+    parser.add_argument("--rays", type=int, default=64)
+    args = parser.parse_args()
+
+    specs = drone_observation_specs(num_rays=args.rays)
+    settings = drone_network_settings()
+    action_spec = drone_action_spec()
+
+    with tempfile.TemporaryDirectory() as run_dir:
+        write_fake_run(run_dir, args.num, specs, settings, action_spec)
+        pt_paths = [p for _, p in list_checkpoints(run_dir, ".pt")]
+        st_paths = [p for _, p in list_checkpoints(run_dir, ".safetensors")]
+
+        def baseline(path):
+            actor = build_actor(specs, settings, action_spec, quiet=False)
+            actor.load_state_dict(torch.load(path, map_location="cpu")[POLICY_KEY])
+            return actor
+
+        skeleton = build_actor(specs, settings, action_spec)
+        rows = [
+            run_case("torch.load + fresh actor", pt_paths, baseline),
+            run_case("mmap + reused skeleton", pt_paths, CheckpointLoader(actor=skeleton).load),
+            run_case("safetensors + reused skeleton", st_paths, CheckpointLoader(actor=skeleton, mmap=False).load),
+            # separate skeleton, assign leaves it holding the mmap'd tensors
+            run_case("mmap + assign", pt_paths,
+                     CheckpointLoader(actor=build_actor(specs, settings, action_spec), assign=True).load),
+        ]
+
+    print_table(rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Shared helpers for benchmarks: synthetic drone specs/settings, timers and memory readings.
+"""
+
+import gc
+import os
+import resource
+import statistics
+import time
+from typing import Callable, Dict, List
+
+from mlagents.torch_utils import torch
+from mlagents_envs.base_env import ActionSpec, ObservationSpec, DimensionProperty, ObservationType
+from mlagents.trainers.settings import NetworkSettings
+
+# Matches the SpatialLidarSensor (6 x rays x 1) + Imu vector setup of the drone agent
+NUM_RAYS = 64
+STATE_SIZE = 32
+NUM_CONTINUOUS_ACTIONS = 4
+
+
+def drone_observation_specs(num_rays: int = NUM_RAYS, state_size: int = STATE_SIZE) -> List[ObservationSpec]:
+    lidar = ObservationSpec(
+        shape=(6, num_rays, 1),
+        dimension_property=(DimensionProperty.NONE,) + (DimensionProperty.TRANSLATIONAL_EQUIVARIANCE,) * 2,  # CHW
+        observation_type=ObservationType.DEFAULT,
+        name="SpatialLidarSensor",
+    )
+    state = ObservationSpec(
+        shape=(state_size,),
+        dimension_property=(DimensionProperty.NONE,),
+        observation_type=ObservationType.DEFAULT,
+        name="ImuSensor",
+    )
+    return [lidar, state]
+
+
+def drone_network_settings(sequence_length: int = 16, memory_size: int = 128, hidden_units: int = 512) -> NetworkSettings:
+    return NetworkSettings(
+        normalize=True,
+        hidden_units=hidden_units,
+        memory=NetworkSettings.MemorySettings(sequence_length=sequence_length, memory_size=memory_size),
+    )
+
+
+def drone_action_spec() -> ActionSpec:
+    return ActionSpec.create_continuous(NUM_CONTINUOUS_ACTIONS)
+
+
+def random_inputs(observation_specs: List[ObservationSpec], batch: int) -> List[torch.Tensor]:
+    return [torch.rand(batch, *spec.shape) for spec in observation_specs]
+
+
+def rss_mb() -> float:
+    """Current resident set size in MB (falls back to peak RSS off linux)"""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2 ** 10
+
+
+def timeit(fn: Callable[[], object], repeat: int = 20, warmup: int = 3) -> Dict[str, float]:
+    """Wall-clock stats of fn in ms"""
+    for _ in range(warmup):
+        fn()
+    gc.collect()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1e3)
+    times.sort()
+    return {
+        "mean": statistics.fmean(times),
+        "p50": times[len(times) // 2],
+        "p99": times[min(len(times) - 1, int(len(times) * 0.99))],
+    }
+
+
+def print_table(rows: List[Dict[str, object]]):
+    if not rows: return
+    cols = list(rows[0].keys())
+    widths = [max(len(c), *(len(_fmt(r[c])) for r in rows)) for c in cols]
+    print("  ".join(c.ljust(w) for c, w in zip(cols, widths)))
+    for r in rows:
+        print("  ".join(_fmt(r[c]).ljust(w) for c, w in zip(cols, widths)))
+
+
+def _fmt(v) -> str:
+    if isinstance(v, float):
+        return f"{v:.2e}" if 0 < abs(v) < 1e-2 else f"{v:.3f}"
+    return str(v)
@@ -0,0 +1,154 @@
+"""
+Stock CuriosityRewardProvider vs FusionCuriosityRewardProvider: evaluate (reward over a trajectory chunk)
+and update (one minibatch, forward + backward) throughput in rows/s.
+The fusion rows run on memories from an actual step-by-step rollout in train mode (ml-agents never switches the
+policy to eval), evaluate reads the rollout encodings back from them. `max_err` is an eval-mode rollout against
+encoding every row again with the snapshot (exact up to float error). In train mode the rollout and a re-encode
+draw different dropout masks: `train_gap` is the evaluate encodings against a re-encode, `dropout_gap` two
+re-encodes against each other (relative mean |diff|).
+
+The stock module runs with vis_encode_type fully_connected, resnet / simple / nature_cnn reject the
+1-wide (6, rays, 1) lidar (min resolution 15+).
+
+PYTHONPATH=. uv run python -m benchmarks.curiosity --rows 512 4096 --modes attention tokens linear
+"""
+
+import argparse
+
+import numpy as np
+from mlagents.torch_utils import torch
+from mlagents_envs.base_env import BehaviorSpec
+from mlagents.trainers.buffer import AgentBuffer, BufferKey
+from mlagents.trainers.settings import CuriositySettings, NetworkSettings, EncoderType
+from mlagents.trainers.torch_entities.components.reward_providers import CuriosityRewardProvider
+from mlagents.trainers.trajectory import ObsUtil
+
+from Custom.checkpoint import build_actor
+from Custom.curiosity import FusionCuriosityRewardProvider
+from Custom.models import FUSION_MODES
+from benchmarks.common import (
+    drone_observation_specs, drone_network_settings, drone_action_spec, timeit, print_table,
+)
+
+
+def synthetic_buffer(specs, action_spec, rows, rng):
+    # Consecutive steps like a trajectory: next_obs[t] == obs[t + 1]
+    buffer = AgentBuffer()
+    for i, spec in enumerate(specs):
+        steps = rng.random((rows + 1, *spec.shape), dtype=np.float32)
+        buffer[ObsUtil.get_name_at(i)].extend(list(steps[:-1]))
+        buffer[ObsUtil.get_name_at_next(i)].extend(list(steps[1:]))
+    buffer[BufferKey.CONTINUOUS_ACTION].extend(list(rng.uniform(-1, 1, (rows, action_spec.continuous_size)).astype(np.float32)))
+    buffer[BufferKey.MASKS].extend(np.ones(rows, dtype=np.float32))
+    return buffer
+
+
+@torch.no_grad()
+def rollout_memories(encoder, buffer, num_obs):
+    # Input memory of every step, as the AgentProcessor stores them
+    obs = [torch.from_numpy(o.to_ndarray()) for o in ObsUtil.from_buffer(buffer, num_obs)]
+    memories = torch.zeros(1, 1, encoder.memory_size)
+    stored = []
+    for t in range(buffer.num_experiences):
+        stored.append(memories[0, 0].numpy().copy())
+        _, memories = encoder.encode([o[t:t + 1] for o in obs], memories)
+    return stored
+
+
+def _reencode(provider, buffer, num_obs):
+    obs = [torch.from_numpy(o.to_ndarray()) for o in ObsUtil.from_buffer(buffer, num_obs)]
+    memories = torch.from_numpy(np.stack(buffer[BufferKey.MEMORY])).unsqueeze(0)
+    return provider._snapshot.encode(obs, memories)[0]
+
+
+@torch.no_grad()
+def max_encoding_error(provider, buffer, num_obs):
+    current, next_ = provider._encodings(buffer)
+    reference = _reencode(provider, buffer, num_obs)
+    return max((current - reference).abs().max().item(), (next_[:-1] - reference[1:]).abs().max().item())
+
+
+@torch.no_grad()
+def train_mode_gaps(provider, buffer, num_obs):
+    """mean |diff| / mean |encoding| of the evaluate encodings vs a re-encode, and of two re-encodes (dropout alone)"""
+    current, _ = provider._encodings(buffer)
+    first, second = _reencode(provider, buffer, num_obs), _reencode(provider, buffer, num_obs)
+    relative = lambda a, b: ((a - b).abs().mean() / b.abs().mean()).item()
+    return relative(current, first), relative(second, first)
+
+
+def bench_provider(name, provider, buffer, repeat, before_update=lambda: None):
+    rows = buffer.num_experiences
+    provider.update(buffer)  # evaluate returns zeros before the first update
+    evaluate = timeit(lambda: provider.evaluate(buffer), repeat=repeat)
+
+    def update():
+        before_update()
+        provider.update(buffer)
+
+    update = timeit(update, repeat=repeat)
+    return {
+        "provider": name,
+        "rows": rows,
+        "params": sum(p.numel() for m in provider.get_modules().values() for p in m.parameters()),
+        "evaluate_ms": evaluate["p50"],
+        "evaluate_rows_s": rows / evaluate["p50"] * 1e3,
+        "update_ms": update["p50"],
+        "update_rows_s": rows / update["p50"] * 1e3,
+        "max_err": "-",
+        "train_gap": "-",
+        "dropout_gap": "-",
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[512, 4096])
+    parser.add_argument("--sequence-length", type=int, default=16)
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--modes", nargs="+", default=list(FUSION_MODES), choices=FUSION_MODES)
+    args = parser.parse_args()
+
+    torch.manual_seed(0)
+    rng = np.random.default_rng(0)
+    specs = drone_observation_specs()
+    action_spec = drone_action_spec()
+    behavior_spec = BehaviorSpec(specs, action_spec)
+
+    settings = drone_network_settings(sequence_length=args.sequence_length)
+    stock_settings = CuriositySettings(network_settings=NetworkSettings(vis_encode_type=EncoderType.FULLY_CONNECTED))
+    stock = CuriosityRewardProvider(behavior_spec, stock_settings)
+    actors = {mode: build_actor(specs, settings, action_spec, fusion_mode=mode) for mode in args.modes}
+
+    table = []
+    for rows in args.rows:
+        buffer = synthetic_buffer(specs, action_spec, rows, rng)
+        table.append(bench_provider("stock (fully_connected)", stock, buffer, args.repeat))
+
+        for mode, actor in actors.items():
+            fusion = FusionCuriosityRewardProvider(behavior_spec, CuriositySettings(), encoder=actor.encoder)
+            actor.eval()
+            buffer[BufferKey.MEMORY].set(rollout_memories(actor.encoder, buffer, len(specs)))
+            max_err = max_encoding_error(fusion, buffer, len(specs))
+
+            actor.train()
+            buffer[BufferKey.MEMORY].set(rollout_memories(actor.encoder, buffer, len(specs)))
+            row = bench_provider(f"fusion {mode} (rollout memories)", fusion, buffer, args.repeat)
+            row["max_err"] = max_err
+            row["train_gap"], row["dropout_gap"] = train_mode_gaps(fusion, buffer, len(specs))
+            table.append(row)
+
+            # The PPO update has already run the actor over the minibatch, not part of the curiosity cost
+            obs = [torch.from_numpy(o.to_ndarray()) for o in ObsUtil.from_buffer(buffer, len(specs))]
+            memories = torch.zeros(1, rows // args.sequence_length, actor.memory_size)
+            policy_encoding, _ = actor.encoder.encode(obs, memories, args.sequence_length)
+
+            def policy_pass():
+                actor.encoder.last_training_encoding = policy_encoding.detach()
+
+            table.append(bench_provider(f"fusion {mode} (policy encodings)", fusion, buffer, args.repeat, policy_pass))
+    print_table(table)
+
+
+if __name__ == "__main__":
+    main()
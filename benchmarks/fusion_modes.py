@@ -0,0 +1,137 @@
+"""
+Windowed attention (sequential unroll) vs tokens (one causal pass) vs linear (recurrent state) fusion:
+memory per agent, rollout step latency and training (sequence_length = context, forward + backward)
+latency across context lengths.
+Before timing, checks that a training sequence encoded in one call matches the same steps encoded one at a
+time (sequence lengths below and above the context), and that the linear attention's parallel form matches
+its recurrent form, outputs and final state.
+
+PYTHONPATH=. uv run python -m benchmarks.fusion_modes --contexts 16 32 64 128
+"""
+
+import argparse
+
+from mlagents.torch_utils import torch
+
+from Custom.checkpoint import build_actor
+from Custom.models import FUSION_MODES
+from benchmarks.common import (
+    drone_observation_specs, drone_network_settings, drone_action_spec, random_inputs, timeit, print_table,
+)
+
+
+def _relative_diff(a, b):
+    # carried states (linear kv / z sums) grow with the sequence, compare them relative to their magnitude
+    return float((a - b).abs().max() / b.abs().max().clamp(min=1.0))
+
+
+@torch.no_grad()
+def check_sequence_parity(encoder, specs, sequences, length, warmup=3):
+    """encode(..., sequence_length=length) vs length single-step encodes: max |encoding diff|, final memories diff"""
+    memories = torch.zeros(1, sequences, encoder.memory_size)
+    for _ in range(warmup):  # start from a non-empty context
+        _, memories = encoder.encode(random_inputs(specs, sequences), memories, 1)
+
+    inputs = random_inputs(specs, sequences * length)  # rows b * length + t
+    encoding, memories_seq = encoder.encode(inputs, memories, length)
+    encoding = encoding.reshape(sequences, length, -1)
+
+    worst_enc, memories_step = 0.0, memories
+    for t in range(length):
+        rows = torch.arange(sequences) * length + t
+        step, memories_step = encoder.encode([x[rows] for x in inputs], memories_step, 1)
+        worst_enc = max(worst_enc, float((step - encoding[:, t]).abs().max()))
+    return worst_enc, _relative_diff(memories_seq, memories_step)
+
+
+@torch.no_grad()
+def check_linear_forms(attn, batch, length):
+    """LinearCausalAttention parallel form (L > 1) vs the recurrent one step at a time, outputs and final state"""
+    C = attn.proj.in_features
+    _, state = attn(torch.randn(batch, 8, C), torch.zeros(batch, attn.state_size))  # non-empty carried state
+    x = torch.randn(batch, length, C)
+    y_parallel, state_parallel = attn(x, state)
+    y_recurrent = []
+    for t in range(length):
+        y, state = attn(x[:, t:t + 1], state)
+        y_recurrent.append(y)
+    y_recurrent = torch.cat(y_recurrent, dim=1)
+    return float((y_parallel - y_recurrent).abs().max()), _relative_diff(state_parallel, state)
+
+
+def check_parity(modes, context, specs, atol):
+    rows = []
+    for mode in modes:
+        actor = build_actor(specs, drone_network_settings(sequence_length=context), drone_action_spec(), fusion_mode=mode)
+        encoder = actor.eval().encoder
+        for length in sorted({max(2, context // 2), context, 2 * context + 3}):
+            worst_enc, worst_mem = check_sequence_parity(encoder, specs, 4, length)
+            rows.append({"check": f"{mode} sequence vs steps", "context": context, "length": length,
+                         "max_out_diff": worst_enc, "max_state_rel_diff": worst_mem})
+        if mode == "linear":
+            for length in (2, context, 4 * context):
+                worst_y, worst_state = check_linear_forms(encoder.sensor_fusion.attn, 4, length)
+                rows.append({"check": "linear parallel vs recurrent", "context": context, "length": length,
+                             "max_out_diff": worst_y, "max_state_rel_diff": worst_state})
+    print_table(rows)
+    failed = [r for r in rows if r["max_out_diff"] > atol or r["max_state_rel_diff"] > atol]
+    if failed:
+        raise SystemExit(f"Parity FAILED (atol {atol:.0e}): {failed}")
+    print("Parity OK: sequence encodes match single steps, linear parallel matches recurrent")
+
+
+def bench_mode(mode, context, specs, rollout_batch, train_sequences, repeat):
+    actor = build_actor(specs, drone_network_settings(sequence_length=context), drone_action_spec(), fusion_mode=mode)
+    encoder = actor.encoder
+
+    # Rollout: one step for rollout_batch agents
+    actor.eval()
+    step_inputs = random_inputs(specs, rollout_batch)
+    step_memories = torch.zeros(1, rollout_batch, encoder.memory_size)
+    with torch.no_grad():
+        rollout = timeit(lambda: encoder.encode(step_inputs, step_memories, 1), repeat=repeat)
+
+    # Training: train_sequences sequences of length context, forward + backward
+    actor.train()
+    train_inputs = random_inputs(specs, train_sequences * context)
+    train_memories = torch.zeros(1, train_sequences, encoder.memory_size)
+
+    def train_step():
+        encoding, _ = encoder.encode(train_inputs, train_memories, context)
+        encoding.sum().backward()
+
+    train = timeit(train_step, repeat=max(3, repeat // 4), warmup=1)
+
+    return {
+        "mode": mode,
+        "context": context,
+        "memory_floats": encoder.memory_size,
+        "memory_kb_per_agent": encoder.memory_size * 4 / 1024,
+        "rollout_ms": rollout["p50"],
+        "train_ms": train["p50"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--contexts", type=int, nargs="+", default=[16, 32, 64, 128])
+    parser.add_argument("--rollout-batch", type=int, default=256)
+    parser.add_argument("--train-sequences", type=int, default=16)
+    parser.add_argument("--modes", nargs="+", default=list(FUSION_MODES), choices=FUSION_MODES)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--atol", type=float, default=1e-4)
+    args = parser.parse_args()
+
+    torch.manual_seed(0)
+    specs = drone_observation_specs()
+    check_parity(args.modes, min(args.contexts), specs, args.atol)
+
+    rows = []
+    for context in args.contexts:
+        for mode in args.modes:
+            rows.append(bench_mode(mode, context, specs, args.rollout_batch, args.train_sequences, args.repeat))
+    print_table(rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+uint8 / fp16 lidar storage: fidelity against float32 (raw values, encodings, actions) and update buffer memory.
+
+PYTHONPATH=. uv run python -m benchmarks.lidar_quant --entries 163840
+"""
+
+import argparse
+
+import numpy as np
+from mlagents.torch_utils import torch
+from mlagents.trainers.buffer import AgentBuffer
+from mlagents.trainers.trajectory import ObsUtil
+
+from Custom.checkpoint import build_actor
+from Custom.quantization import QUANT_DTYPES, LidarQuantConfig, LidarQuantizer, compact_buffer
+from benchmarks.common import (
+    drone_observation_specs, drone_network_settings, drone_action_spec, random_inputs, print_table,
+)
+
+
+def realistic_lidar(batch, shape, rng):
+    # 1 - d / maxDistance with ~40% of rays missing (0)
+    lidar = rng.random((batch, *shape), dtype=np.float32)
+    lidar[rng.random(lidar.shape) < 0.4] = 0.0
+    return lidar
+
+
+@torch.no_grad()
+def fidelity(specs, batch, rng):
+    rows = []
+    inputs = random_inputs(specs, batch)
+    inputs[0] = torch.from_numpy(realistic_lidar(batch, specs[0].shape, rng))
+
+    for dtype in QUANT_DTYPES:
+        torch.manual_seed(0)
+        actor = build_actor(specs, drone_network_settings(), drone_action_spec(), lidar_quant=dtype).eval()
+        memories = torch.zeros(1, batch, actor.memory_size)
+        quantizer = actor.encoder.lidar_quantizer
+
+        codes = quantizer.quantize(inputs[0].numpy())
+        enc_ref, _ = actor.encoder.encode(inputs, memories)
+        act_ref = actor.action_model.get_action_out(enc_ref, None)[3]
+
+        # Stored codes, and the same codes after ModelUtils.list_to_tensor's float32 cast
+        for stored, lidar in (("codes", torch.from_numpy(codes)), ("codes->float32", torch.from_numpy(codes).float())):
+            enc_q, _ = actor.encoder.encode([lidar] + inputs[1:], memories, lidar_codes=True)
+            act_q = actor.action_model.get_action_out(enc_q, None)[3]
+            rows.append({
+                "dtype": dtype,
+                "input": stored,
+                "max_obs_err": float(np.abs(quantizer.dequantize(codes) - inputs[0].numpy()).max()),
+                "max_encoding_err": float((enc_ref - enc_q).abs().max()),
+                "max_action_err": float((act_ref - act_q).abs().max()),
+            })
+    return rows
+
+
+def buffer_memory(specs, entries, rng):
+    # obs + next_obs lidar entries, like the update buffer after resequence_and_append
+    rows = []
+    for dtype in QUANT_DTYPES:
+        buffer = AgentBuffer()
+        for key in (ObsUtil.get_name_at(0), ObsUtil.get_name_at_next(0)):
+            buffer[key].extend(list(realistic_lidar(entries, specs[0].shape, rng)))
+        quantizer = LidarQuantizer(LidarQuantConfig(dtype=dtype))
+        report = compact_buffer(buffer, [0], quantizer)
+        rows.append({
+            "dtype": dtype,
+            "entries": entries,
+            "float32_mb": report["float32_bytes"] / 2 ** 20,
+            "compact_mb": report["compact_bytes"] / 2 ** 20,
+            "saved_mb": (report["float32_bytes"] - report["compact_bytes"]) / 2 ** 20,
+        })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--entries", type=int, default=163840)
+    parser.add_argument("--batch", type=int, default=256)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    specs = drone_observation_specs()
+    print_table(fidelity(specs, args.batch, rng))
+    print()
+    print_table(buffer_memory(specs, args.entries, rng))
+
+
+if __name__ == "__main__":
+    main()
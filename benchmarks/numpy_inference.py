@@ -0,0 +1,111 @@
+"""
+NumpyActor vs torch CustomActor: parity of deterministic actions / memories over a rollout,
+import time, RSS and per-step latency.
+
+PYTHONPATH=. uv run python -m benchmarks.numpy_inference --steps 32
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+from mlagents.torch_utils import torch
+
+from Custom.checkpoint import build_actor, export_numpy
+from Custom.numpy_inference import NumpyActor
+from benchmarks.common import (
+    drone_observation_specs, drone_network_settings, drone_action_spec, random_inputs, timeit, print_table,
+)
+
+_IMPORT_PROBE = """
+import os, time
+t = time.perf_counter()
+import {module}
+t = time.perf_counter() - t
+with open("/proc/self/statm") as f:
+    rss = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+print(t * 1e3, rss)
+"""
+
+
+def import_cost(module):
+    # fresh interpreter per module so nothing is already imported
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [os.getcwd(), os.environ.get("PYTHONPATH")])))
+    out = subprocess.run([sys.executable, "-W", "ignore", "-c", _IMPORT_PROBE.format(module=module)],
+                         env=env, capture_output=True, text=True, check=True)
+    ms, rss = out.stdout.split()[-2:]
+    return {"module": module, "import_ms": float(ms), "rss_mb": float(rss)}
+
+
+@torch.no_grad()
+def randomize_stats(actor):
+    # non-trivial normalizer / BatchNorm stats so parity covers them
+    encoder = actor.encoder
+    if encoder.normalize:
+        encoder.state_norm.mean.uniform_(-1, 1)
+        encoder.state_norm.var.uniform_(0.5, 2)
+    for module in actor.modules():
+        if isinstance(module, torch.nn.BatchNorm1d):
+            module.running_mean.uniform_(-0.5, 0.5)
+            module.running_var.uniform_(0.5, 2)
+            module.weight.uniform_(0.5, 1.5)
+            module.bias.uniform_(-0.5, 0.5)
+
+
+@torch.no_grad()
+def check_parity(actor, np_actor, specs, batch, steps, atol):
+    torch_mem = torch.zeros(1, batch, actor.memory_size)
+    np_mem = np_actor.initial_memories(batch)
+    worst_action, worst_mem = 0.0, 0.0
+    for _ in range(steps):
+        inputs = random_inputs(specs, batch)
+        out = actor(inputs, None, torch_mem)
+        torch_action, torch_mem = out[4], out[-1]
+        action, np_mem = np_actor.act([x.numpy() for x in inputs], np_mem)
+        worst_action = max(worst_action, float(np.abs(action.continuous - torch_action.numpy()).max()))
+        worst_mem = max(worst_mem, float(np.abs(np_mem - torch_mem.reshape(batch, -1).numpy()).max()))
+    if worst_action > atol or worst_mem > atol:
+        raise SystemExit(f"Parity FAILED: max |action diff| {worst_action:.2e}, max |memory diff| {worst_mem:.2e}")
+    print(f"Parity OK over {steps} steps: max |action diff| {worst_action:.2e}, max |memory diff| {worst_mem:.2e}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--steps", type=int, default=32)
+    parser.add_argument("--atol", type=float, default=1e-4)
+    parser.add_argument("--batches", type=int, nargs="+", default=[1, 16, 128])
+    args = parser.parse_args()
+
+    torch.manual_seed(0)
+    specs = drone_observation_specs()
+    actor = build_actor(specs, drone_network_settings(), drone_action_spec()).eval()
+    randomize_stats(actor)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        np_actor = NumpyActor.load(export_numpy(actor, os.path.join(tmp, "actor.npz")))
+
+    check_parity(actor, np_actor, specs, batch=8, steps=args.steps, atol=args.atol)
+
+    torch.set_num_threads(1)  # match single threaded numpy for a fair per-core number
+    rows = []
+    for batch in args.batches:
+        inputs = random_inputs(specs, batch)
+        np_inputs = [x.numpy() for x in inputs]
+        torch_mem = torch.zeros(1, batch, actor.memory_size)
+        np_mem = np_actor.initial_memories(batch)
+
+        with torch.no_grad():
+            t_torch = timeit(lambda: actor(inputs, None, torch_mem))
+        t_np = timeit(lambda: np_actor.act(np_inputs, np_mem))
+        rows.append({"batch": batch, "torch_ms": t_torch["p50"], "numpy_ms": t_np["p50"]})
+    print_table(rows)
+
+    print()
+    print_table([import_cost("Custom.numpy_inference"), import_cost("Custom.networks")])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+PolicyServer load generator: env worker processes send unevenly sized step requests (1..NUM_AREAS agents)
+over the Unix socket, unbatched (max_batch 1, one forward per request) vs dynamic batching.
+Reports request latency p50 / p99 and actions/sec, weights are hot-swapped every --swap-every seconds.
+
+PYTHONPATH=. uv run python -m benchmarks.policy_server --workers 32 --max-agents 32
+"""
+
+import argparse
+import multiprocessing as mp
+import os
+import tempfile
+import time
+
+import numpy as np
+from mlagents.torch_utils import torch
+
+from Custom.checkpoint import build_actor
+from Custom.policy_server import PolicyServer, PolicyClient
+from benchmarks.common import drone_observation_specs, drone_network_settings, drone_action_spec, print_table
+
+
+def worker(socket_path, worker_id, max_agents, requests, start, results):
+    rng = np.random.default_rng(worker_id)
+    client = PolicyClient(socket_path, worker_id)
+    obs = [rng.random((max_agents, *shape), dtype=np.float32) for shape in client.obs_shapes]
+    episode_start = np.ones(max_agents, dtype=np.uint8)
+
+    start.wait()
+    latencies, agents = [], 0
+    for _ in range(requests):
+        n = int(rng.integers(1, max_agents + 1))  # agents requesting a decision this step
+        t = time.perf_counter()
+        client.act(np.arange(n), [o[:n] for o in obs], episode_start[:n])
+        latencies.append((time.perf_counter() - t) * 1e3)
+        agents += n
+        episode_start[:n] = 0
+    client.close()
+    results.put((latencies, agents))
+
+
+def run(actor, name, max_batch, max_wait_ms, args):
+    socket_path = os.path.join(tempfile.mkdtemp(), "policy.sock")
+    ctx = mp.get_context("fork")
+    start, results = ctx.Event(), ctx.Queue()
+
+    with PolicyServer(actor, socket_path, max_batch=max_batch, max_wait_ms=max_wait_ms) as server:
+        workers = [
+            ctx.Process(target=worker, args=(socket_path, i, args.max_agents, args.requests, start, results))
+            for i in range(args.workers)
+        ]
+        for p in workers:
+            p.start()
+        time.sleep(0.5)  # connected
+
+        begin = time.perf_counter()
+        start.set()
+        outputs, swaps, last_swap = [], 0, begin
+        while len(outputs) < args.workers:
+            try:
+                outputs.append(results.get(timeout=0.05))
+            except Exception:
+                pass
+            if time.perf_counter() - last_swap > args.swap_every:
+                server.update_weights(actor.state_dict())  # like loading a newer checkpoint mid-evaluation
+                last_swap = time.perf_counter()
+                swaps += 1
+        wall = time.perf_counter() - begin
+        for p in workers:
+            p.join()
+
+        latencies = np.concatenate([l for l, _ in outputs])
+        agents = sum(a for _, a in outputs)
+        return {
+            "mode": name,
+            "max_batch": max_batch,
+            "max_wait_ms": max_wait_ms,
+            "agents_per_forward": server.num_agents / max(1, server.num_batches),
+            "p50_ms": float(np.percentile(latencies, 50)),
+            "p99_ms": float(np.percentile(latencies, 99)),
+            "actions_s": agents / wall,
+            "swaps": f"{server.weights_version}/{swaps}",
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=32)
+    parser.add_argument("--max-agents", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--max-batch", type=int, default=1024)
+    parser.add_argument("--max-wait-ms", type=float, nargs="+", default=[1.0, 5.0])
+    parser.add_argument("--swap-every", type=float, default=1.0)
+    args = parser.parse_args()
+
+    torch.manual_seed(0)
+    actor = build_actor(drone_observation_specs(), drone_network_settings(), drone_action_spec())
+
+    rows = [run(actor, "unbatched", 1, 0.0, args)]
+    for max_wait_ms in args.max_wait_ms:
+        rows.append(run(actor, "batched", args.max_batch, max_wait_ms, args))
+    print_table(rows)
+
+
+if __name__ == "__main__":
+    main()